@@ -0,0 +1,338 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+import requests
+from flota import MODOS, FlotaSensores, generar_clave, guardar_privada, guardar_publica
+
+# CONFIGURACIÓN
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_FINAL = os.path.join(RAIZ, "servidor_final_py", "main.py")
+MAIN_INTERMEDIO = os.path.join(RAIZ, "servidor_intermedio_py", "main.py")
+PUERTO_INTERMEDIO = 4000
+PUERTO_API = 8000
+ARCHIVO_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados.jsonl")
+TIMEOUT_ARRANQUE = 30  # segundos esperando que cada servidor acepte conexiones
+LIMITE_FEED = 10000  # filas por consulta al feed after_id
+ESPERA_FEED = 0.01  # segundos entre consultas cuando el feed no trae nada nuevo
+MUESTREO_MEMORIA = 0.5  # segundos entre lecturas de memoria de cada proceso
+
+
+# Misma lógica que los servidores: escuchan en la IP de la red local (o 127.0.0.1 sin red)
+# Código obtenido de stackoverflow, pregunta 166506
+def obtener_ip_servidor():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.settimeout(0)
+    try:
+        s.connect(('10.254.254.254', 1))
+        IP = s.getsockname()[0]
+    except Exception:
+        IP = '127.0.0.1'
+    finally:
+        s.close()
+    return IP
+
+# Memoria residente del proceso en MB según /proc (solo Linux), None si no se puede leer
+def memoria_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))]
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# Servidores del pipeline corriendo en un directorio de trabajo temporal
+# Cada servidor se lanza con su main.py original y un config.json que solo cambia lo necesario
+# para correr en esta máquina (dirección del final, directorio de claves, modo de ingesta)
+class Pipeline:
+    def __init__(self, directorio, host, modo_intermedio):
+        self.directorio = directorio
+        self.host = host
+        self.dir_final = os.path.join(directorio, "final")
+        self.dir_intermedio = os.path.join(directorio, "intermedio")
+        self.dir_claves = os.path.join(self.dir_intermedio, "claves")
+        for d in (self.dir_final, self.dir_claves):
+            os.makedirs(d, exist_ok=True)
+
+        # par de claves propio del intermedio para firmar lotes hacia el final
+        clave = generar_clave()
+        guardar_privada(clave, os.path.join(self.dir_intermedio, "clave_intermedio.pem"))
+        guardar_publica(clave, os.path.join(self.dir_final, "pub_intermedio.pem"))
+        self._escribir_config(self.dir_final, {"NIVEL_LOG": 30})
+        self._escribir_config(self.dir_intermedio, {
+            "SERVER_FINAL_IP": host,
+            "DIRECTORIO_CLAVES": "claves",
+            "MODO_SERVIDOR": modo_intermedio,
+            "NIVEL_LOG": 30
+        })
+        self.procesos = {}
+
+    @staticmethod
+    def _escribir_config(directorio, config):
+        with open(os.path.join(directorio, "config.json"), "w") as f:
+            json.dump(config, f, indent=4)
+
+    def _lanzar(self, nombre, main, directorio):
+        salida = open(os.path.join(directorio, "salida.log"), "w")
+        self.procesos[nombre] = subprocess.Popen([sys.executable, main], cwd=directorio,
+                                                 stdout=salida, stderr=subprocess.STDOUT)
+
+    def _esperar(self, nombre, listo):
+        limite = time.monotonic() + TIMEOUT_ARRANQUE
+        while time.monotonic() < limite:
+            if self.procesos[nombre].poll() is not None:
+                raise RuntimeError(f"{nombre} terminó al arrancar, ver {self.directorio}")
+            if listo():
+                return
+            time.sleep(0.2)
+        raise RuntimeError(f"{nombre} no respondió en {TIMEOUT_ARRANQUE} s")
+
+    def _api_lista(self):
+        try:
+            return requests.get(f"http://{self.host}:{PUERTO_API}/api/ultimas", timeout=1).ok
+        except requests.RequestException:
+            return False
+
+    def _intermedio_listo(self):
+        # el intermedio solo abre su puerto después de cargar la clave y levantar los enlaces;
+        # la conexión vacía de la prueba se registra como paquete incompleto y se descarta
+        try:
+            socket.create_connection((self.host, PUERTO_INTERMEDIO), timeout=1).close()
+            return True
+        except OSError:
+            return False
+
+    def iniciar(self):
+        self._lanzar("servidor_final", MAIN_FINAL, self.dir_final)
+        self._esperar("servidor_final", self._api_lista)
+        self._lanzar("servidor_intermedio", MAIN_INTERMEDIO, self.dir_intermedio)
+        self._esperar("servidor_intermedio", self._intermedio_listo)
+
+    def detener(self):
+        for proceso in self.procesos.values():
+            proceso.terminate()
+        for proceso in self.procesos.values():
+            try:
+                proceso.wait(5)
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+
+
+# Sigue el feed after_id del servidor final y registra cuándo se vuelve consultable cada medición
+class Observador(threading.Thread):
+    def __init__(self, host, enviadas, lock):
+        super().__init__(daemon=True)
+        self.url = f"http://{host}:{PUERTO_API}/api/mediciones"
+        self.enviadas = enviadas
+        self.lock = lock
+        self.sesion = requests.Session()
+        self.latencias = []
+        self.desconocidas = 0
+        self.primera = None
+        self.ultima = None
+        self.ultimo_id = 0
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.is_set():
+            try:
+                respuesta = self.sesion.get(self.url, params={"after_id": self.ultimo_id, "limit": LIMITE_FEED},
+                                            timeout=10)
+                respuesta.raise_for_status()
+                filas = respuesta.json()
+            except requests.RequestException:
+                self._detener.wait(ESPERA_FEED)
+                continue
+            ahora = time.monotonic()
+            with self.lock:
+                for fila in filas:
+                    enviada = self.enviadas.get((fila["sensor_id"], fila["timestamp"]))
+                    if enviada is None:
+                        self.desconocidas += 1
+                    else:
+                        self.latencias.append(ahora - enviada)
+            if filas:
+                self.ultimo_id = filas[-1]["id"]
+                self.primera = self.primera or ahora
+                self.ultima = ahora
+            if len(filas) < LIMITE_FEED:
+                self._detener.wait(ESPERA_FEED)
+
+    def detener(self):
+        self._detener.set()
+        self.join()
+
+
+# Lee la memoria de cada proceso periódicamente y guarda el máximo y el último valor
+class MonitorMemoria(threading.Thread):
+    def __init__(self, pids):
+        super().__init__(daemon=True)
+        self.pids = pids  # nombre -> pid
+        self.maximo = {}
+        self.ultimo = {}
+        self._detener = threading.Event()
+
+    def run(self):
+        while True:
+            for nombre, pid in self.pids.items():
+                mb = memoria_mb(pid)
+                if mb is not None:
+                    self.ultimo[nombre] = mb
+                    self.maximo[nombre] = max(mb, self.maximo.get(nombre, 0))
+            if self._detener.wait(MUESTREO_MEMORIA):
+                break
+
+    def detener(self):
+        self._detener.set()
+        self.join()
+
+    def resumen(self):
+        return {nombre: {"rss_max_mb": round(self.maximo[nombre], 1), "rss_final_mb": round(self.ultimo[nombre], 1)}
+                for nombre in self.maximo}
+
+
+def ejecutar(args):
+    host = obtener_ip_servidor()
+    directorio = args.directorio or tempfile.mkdtemp(prefix="benchmark_redes_")
+    pipeline = Pipeline(directorio, host, args.modo)
+    print(f"[~] Generando {args.sensores} claves de sensor en {directorio}...")
+    flota = FlotaSensores(args.sensores, pipeline.dir_claves, host, PUERTO_INTERMEDIO, args.tasa,
+                          modo=args.envio, tam_lote=args.lote)
+    try:
+        pipeline.iniciar()
+        observador = Observador(host, flota.enviadas, flota.lock)
+        memoria = MonitorMemoria(dict({nombre: p.pid for nombre, p in pipeline.procesos.items()},
+                                      generador=os.getpid()))
+        observador.start()
+        memoria.start()
+
+        print(f"[~] Enviando durante {args.duracion} s...")
+        inicio = time.monotonic()
+        flota.iniciar(args.duracion)
+        flota.esperar()
+        fin_envio = time.monotonic()
+
+        # se espera a que todo lo enviado aparezca en la API (o se agote la espera)
+        limite = fin_envio + args.espera_final
+        while len(observador.latencias) + observador.desconocidas < len(flota.enviadas) \
+                and time.monotonic() < limite:
+            time.sleep(0.1)
+        observador.detener()
+        memoria.detener()
+    finally:
+        pipeline.detener()
+
+    enviadas = len(flota.enviadas)
+    visibles = len(observador.latencias)
+    latencias_ms = [l * 1000 for l in observador.latencias]
+    duracion_envio = fin_envio - inicio
+    duracion_visible = (observador.ultima - inicio) if observador.ultima else None
+    resultado = {
+        "fecha": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": commit_actual(),
+        "parametros": {
+            "sensores": args.sensores,
+            "tasa_por_sensor": args.tasa,
+            "duracion_s": args.duracion,
+            "modo_intermedio": args.modo,
+            "envio": args.envio,
+            "tam_lote": args.lote if args.envio == "lote" else 1
+        },
+        "enviadas": enviadas,
+        "errores_envio": flota.errores,
+        "adelanto_agotado": flota.adelanto_agotado,
+        "visibles": visibles,
+        "perdidas": enviadas - visibles,
+        "envio_por_seg": round(enviadas / duracion_envio, 1),
+        "lecturas_por_seg": round(visibles / duracion_visible, 1) if duracion_visible else 0,
+        "latencia_ms": {
+            "p50": round(percentil(latencias_ms, 50), 1) if latencias_ms else None,
+            "p99": round(percentil(latencias_ms, 99), 1) if latencias_ms else None,
+            "max": round(max(latencias_ms), 1) if latencias_ms else None
+        },
+        "memoria": memoria.resumen()
+    }
+    if not args.conservar and not args.directorio:
+        shutil.rmtree(directorio, ignore_errors=True)
+    return resultado
+
+# Último resultado guardado con los mismos parámetros, para comparar
+def anterior(ruta, parametros):
+    previo = None
+    try:
+        with open(ruta) as f:
+            for linea in f:
+                registro = json.loads(linea)
+                if registro.get("parametros") == parametros:
+                    previo = registro
+    except FileNotFoundError:
+        pass
+    return previo
+
+def variacion(actual, previo):
+    if actual is None or not previo:
+        return ""
+    return f" ({(actual - previo) / previo * 100:+.1f}% vs {previo})"
+
+def imprimir(resultado, previo):
+    p = previo or {}
+    latencia_previa = p.get("latencia_ms", {})
+    print(f"Enviadas: {resultado['enviadas']} ({resultado['envio_por_seg']}/s), "
+          f"visibles: {resultado['visibles']}, perdidas: {resultado['perdidas']}, "
+          f"errores de envío: {resultado['errores_envio']}")
+    if resultado.get("adelanto_agotado"):
+        print("[!] Algunos sensores dejaron de enviar: sus timestamps llegaban al máximo adelanto que acepta el intermedio")
+    print(f"Lecturas/s sostenidas: {resultado['lecturas_por_seg']}"
+          f"{variacion(resultado['lecturas_por_seg'], p.get('lecturas_por_seg'))}")
+    for clave in ("p50", "p99"):
+        print(f"Latencia {clave}: {resultado['latencia_ms'][clave]} ms"
+              f"{variacion(resultado['latencia_ms'][clave], latencia_previa.get(clave))}")
+    for nombre, memoria in resultado["memoria"].items():
+        print(f"Memoria {nombre}: {memoria['rss_max_mb']} MB máx, {memoria['rss_final_mb']} MB al final")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline sensor -> intermedio -> final en esta máquina")
+    parser.add_argument("--sensores", type=int, default=50, help="cantidad de sensores simulados")
+    parser.add_argument("--tasa", type=float, default=5.0, help="mediciones por segundo por sensor (0 = sin límite)")
+    parser.add_argument("--duracion", type=float, default=30.0, help="segundos enviando")
+    parser.add_argument("--modo", choices=("hilos", "asyncio"), default="hilos", help="MODO_SERVIDOR del intermedio")
+    parser.add_argument("--envio", choices=MODOS, default="conexion",
+                        help="una conexión por medición, sesión persistente o sesión con lotes firmados")
+    parser.add_argument("--lote", type=int, default=10, help="mediciones por lote con --envio lote")
+    parser.add_argument("--espera-final", type=float, default=30.0,
+                        help="segundos máximos esperando que lo enviado aparezca en la API")
+    parser.add_argument("--salida", default=ARCHIVO_RESULTADOS, help="archivo JSONL donde se agrega el resultado")
+    parser.add_argument("--directorio", help="directorio de trabajo (por defecto uno temporal que se borra)")
+    parser.add_argument("--conservar", action="store_true", help="no borrar el directorio temporal")
+    args = parser.parse_args()
+
+    resultado = ejecutar(args)
+    previo = anterior(args.salida, resultado["parametros"])
+    imprimir(resultado, previo)
+    with open(args.salida, "a") as f:
+        f.write(json.dumps(resultado) + "\n")
+    print(f"[✓] Resultado agregado a {args.salida}")
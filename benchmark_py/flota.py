@@ -0,0 +1,185 @@
+import os
+import socket
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+FORMATO_TIMESTAMP = "%Y-%m-%d %H:%M:%S"  # como lo devuelve /api/mediciones
+TAM_CLAVE = 2048  # firma de 256 bytes, el paquete completo mide 22 + 256 = 278
+TIMEOUT_ENVIO = 5.0
+ADELANTO_MAXIMO = 86400  # MAX_ADELANTO_SEG del intermedio: lo fechado más adelante se descarta
+ATRASO_SIN_TASA = 30 * 86400  # con tasa 0 no se sabe cuántas habrá: se empieza así de atrás
+MODOS = ("conexion", "sesion", "lote")
+# Protocolo de sesión del intermedio (servidor_intermedio_py/sesion.py)
+CABECERA_SESION = struct.Struct('<hBh')  # marca -1, versión, sensor_id
+VERSION_SESION = 1
+TIPO_MEDICION = 1
+TIPO_LOTE = 2
+
+
+def generar_clave():
+    return rsa.generate_private_key(public_exponent=65537, key_size=TAM_CLAVE)
+
+# Guarda la clave pública en PEM, como la leen los servidores ({sensorId}.pem, pub_intermedio.pem)
+def guardar_publica(clave, ruta):
+    with open(ruta, "wb") as f:
+        f.write(clave.public_key().public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ))
+
+def guardar_privada(clave, ruta):
+    with open(ruta, "wb") as f:
+        f.write(clave.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        ))
+
+# struct SensorData de cliente_sensor_cpp, empaquetado sin padding
+# (int16 id, uint64 timestamp AAAAMMDDHHMMSS, float temperatura, presion, humedad)
+def registro(sensor_id, instante, temperatura, presion, humedad):
+    return struct.pack('<hQfff', sensor_id, int(instante.strftime("%Y%m%d%H%M%S")), temperatura, presion, humedad)
+
+def firmar(clave, datos):
+    return clave.sign(datos, padding.PKCS1v15(), hashes.SHA256())
+
+# Lo que se envía por cada grupo de registros según el modo:
+# conexion: paquete antiguo de 278 bytes, igual al del cliente C++ (un registro)
+# sesion: mensaje de medición dentro de una sesión (un registro)
+# lote: mensaje de lote dentro de una sesión, una sola firma para todos los registros
+def empaquetar(clave, modo, registros):
+    if modo == "lote":
+        cuerpo = bytes([TIPO_LOTE]) + struct.pack('<H', len(registros)) + b''.join(registros)
+        return cuerpo + firmar(clave, cuerpo)
+    paquete = registros[0] + firmar(clave, registros[0])
+    return bytes([TIPO_MEDICION]) + paquete if modo == "sesion" else paquete
+
+
+# Flota de sensores simulados, un hilo por sensor
+# Cada sensor tiene su propia clave (la pública se deja en directorio_claves para el intermedio)
+# y envía según el modo: una medición por conexión TCP como el cliente C++ ("conexion"), o por una
+# sesión persistente de a una medición ("sesion") o de a lotes de tam_lote ("lote"). El timestamp de cada sensor avanza
+# un segundo por medición desde `inicio`, así (sensor_id, timestamp) identifica cada medición
+# en la API del servidor final y nunca choca con la restricción UNIQUE. Sin `inicio` explícito
+# se empieza en el pasado lo suficiente para que a más de una medición por segundo los
+# timestamps no se adelanten al reloj; un sensor que llegaría a ADELANTO_MAXIMO deja de enviar
+# (el intermedio lo descartaría como futuro) y queda marcado en adelanto_agotado.
+# enviadas[(sensor_id, "AAAA-MM-DD HH:MM:SS")] = instante (time.monotonic) en que se empezó a enviar
+class FlotaSensores:
+    def __init__(self, cantidad, directorio_claves, host, puerto, tasa=1.0, primer_id=1000, inicio=None,
+                 modo="conexion", tam_lote=10):
+        self.host = host
+        self.puerto = puerto
+        self.modo = modo
+        self.tam_lote = tam_lote if modo == "lote" else 1
+        self.tasa = tasa  # mediciones por segundo por sensor, 0 = lo más rápido posible
+        self._inicio_fijo = inicio
+        self.inicio = (inicio or datetime.now()).replace(microsecond=0)
+        self.adelanto_agotado = False
+        self.sensores = []
+        for sensor_id in range(primer_id, primer_id + cantidad):
+            clave = generar_clave()
+            guardar_publica(clave, os.path.join(directorio_claves, f"{sensor_id}.pem"))
+            self.sensores.append((sensor_id, clave))
+        self.enviadas = {}
+        self.errores = 0
+        self.lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilos = []
+
+    def iniciar(self, duracion):
+        self._detener.clear()
+        if self._inicio_fijo is None:
+            atraso = duracion * self.tasa + self.tam_lote if self.tasa else ATRASO_SIN_TASA
+            self.inicio = (datetime.now() - timedelta(seconds=atraso)).replace(microsecond=0)
+        fin = time.monotonic() + duracion
+        for sensor_id, clave in self.sensores:
+            hilo = threading.Thread(target=self._sensor, args=(sensor_id, clave, fin), daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def esperar(self):
+        for hilo in self._hilos:
+            hilo.join()
+        self._hilos = []
+
+    def detener(self):
+        self._detener.set()
+        self.esperar()
+
+    def _enviar(self, paquete):
+        with socket.create_connection((self.host, self.puerto), timeout=TIMEOUT_ENVIO) as s:
+            s.sendall(paquete)
+            # se espera a que el intermedio cierre primero: así el TIME_WAIT queda de su lado
+            # y la flota no se queda sin puertos locales con miles de conexiones por segundo
+            s.shutdown(socket.SHUT_WR)
+            while s.recv(64):
+                pass
+
+    def _abrir_sesion(self, sensor_id):
+        conex = socket.create_connection((self.host, self.puerto), timeout=TIMEOUT_ENVIO)
+        conex.sendall(CABECERA_SESION.pack(-1, VERSION_SESION, sensor_id))
+        if conex.recv(1) != bytes([VERSION_SESION]):
+            conex.close()
+            raise ConnectionError("el intermedio no aceptó la sesión")
+        return conex
+
+    def _cerrar_sesion(self, conex):
+        try:
+            conex.shutdown(socket.SHUT_WR)
+            while conex.recv(64):
+                pass
+        except OSError:
+            pass
+        conex.close()
+
+    def _sensor(self, sensor_id, clave, fin):
+        intervalo = self.tam_lote / self.tasa if self.tasa else 0
+        proximo = time.monotonic()
+        conex = None
+        i = 0
+        while not self._detener.is_set() and time.monotonic() < fin:
+            registros = []
+            claves = []
+            for _ in range(self.tam_lote):
+                instante = self.inicio + timedelta(seconds=i)
+                i += 1
+                # valores que varían por sensor y en el tiempo, dentro de rangos realistas
+                registros.append(registro(sensor_id, instante, 20 + (sensor_id + i) % 10,
+                                          1000 + (i % 20), 40 + (sensor_id % 30)))
+                claves.append((sensor_id, instante.strftime(FORMATO_TIMESTAMP)))
+            if instante > datetime.now() + timedelta(seconds=ADELANTO_MAXIMO):
+                self.adelanto_agotado = True
+                break
+            mensaje = empaquetar(clave, self.modo, registros)
+            # se registra antes de enviar: la medición puede aparecer en la API antes de que vuelva el envío
+            with self.lock:
+                ahora = time.monotonic()
+                for clave_medicion in claves:
+                    self.enviadas[clave_medicion] = ahora
+            try:
+                if self.modo == "conexion":
+                    self._enviar(mensaje)
+                else:
+                    if conex is None:
+                        conex = self._abrir_sesion(sensor_id)
+                    conex.sendall(mensaje)
+            except OSError:
+                with self.lock:
+                    for clave_medicion in claves:
+                        self.enviadas.pop(clave_medicion, None)
+                    self.errores += len(claves)
+                if conex is not None:
+                    conex.close()
+                    conex = None
+            if intervalo:
+                proximo += intervalo
+                espera = proximo - time.monotonic()
+                if espera > 0:
+                    self._detener.wait(espera)
+        if conex is not None:
+            self._cerrar_sesion(conex)
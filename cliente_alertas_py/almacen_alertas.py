@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime as dt
+
+# Severidad por tipo de alerta del motor de reglas
+SEVERIDADES = {"alto": "alta", "bajo": "alta", "cambio": "media"}
+
+
+# Alertas recientes en memoria acotada, compartidas entre el hilo de consulta y los de Flask
+# - buffer circular de las últimas `capacidad` alertas
+# - la misma alerta (sensor, métrica, tipo) no se repite dentro de `ventana_dedup` segundos
+# - índices por sensor, por severidad y por ambos, para responder sin recorrer todo
+# Todos los índices guardan las alertas en orden de registro, así la más antigua de cada índice
+# es siempre la que sale del buffer y se puede quitar en O(1)
+class AlmacenAlertas:
+    def __init__(self, capacidad=10000, ventana_dedup=300):
+        self.capacidad = capacidad
+        self.ventana_dedup = ventana_dedup
+        self._alertas = deque()
+        self._indices = {}  # clave de índice -> deque de alertas
+        self._vistas = OrderedDict()  # (sensor, métrica, tipo) -> instante en que se registró
+        self._lock = threading.Lock()
+        self._siguiente_id = 1
+        self.suprimidas = 0
+
+    @staticmethod
+    def _claves_indice(alerta):
+        return (("sensor", alerta["sensor_id"]), ("severidad", alerta["severidad"]),
+                ("sensor_severidad", alerta["sensor_id"], alerta["severidad"]))
+
+    def _expirar_vistas(self, ahora):
+        while self._vistas:
+            clave, instante = next(iter(self._vistas.items()))
+            if ahora - instante < self.ventana_dedup:
+                break
+            del self._vistas[clave]
+
+    # Registra una alerta del motor de reglas; devuelve False si se suprimió por repetida
+    def agregar(self, alerta):
+        ahora = time.monotonic()
+        clave = (alerta["sensor_id"], alerta["metrica"], alerta["tipo"])
+        with self._lock:
+            self._expirar_vistas(ahora)
+            if clave in self._vistas:
+                self.suprimidas += 1
+                return False
+            self._vistas[clave] = ahora
+
+            alerta = dict(alerta, id=self._siguiente_id, registrada=dt.now().strftime("%Y-%m-%d %H:%M:%S"),
+                          severidad=alerta.get("severidad") or SEVERIDADES.get(alerta["tipo"], "media"))
+            self._siguiente_id += 1
+            self._alertas.append(alerta)
+            for indice in self._claves_indice(alerta):
+                self._indices.setdefault(indice, deque()).append(alerta)
+
+            if len(self._alertas) > self.capacidad:
+                antigua = self._alertas.popleft()
+                for indice in self._claves_indice(antigua):
+                    alertas = self._indices[indice]
+                    alertas.popleft()
+                    if not alertas:
+                        del self._indices[indice]
+            return True
+
+    # Alertas más recientes que cumplen los filtros, en orden de registro
+    # desde compara con la hora de registro "AAAA-MM-DD HH:MM:SS"; como el índice está en ese
+    # mismo orden, se recorre desde el final y se corta apenas aparece una más antigua
+    def consultar(self, sensor_id=None, severidad=None, desde=None, limite=20):
+        with self._lock:
+            if sensor_id is not None and severidad is not None:
+                alertas = self._indices.get(("sensor_severidad", sensor_id, severidad), ())
+            elif sensor_id is not None:
+                alertas = self._indices.get(("sensor", sensor_id), ())
+            elif severidad is not None:
+                alertas = self._indices.get(("severidad", severidad), ())
+            else:
+                alertas = self._alertas
+            resultado = []
+            for alerta in reversed(alertas):
+                if len(resultado) >= limite or (desde is not None and alerta["registrada"] < desde):
+                    break
+                resultado.append(alerta)
+        resultado.reverse()
+        return resultado
+
+    def __len__(self):
+        with self._lock:
+            return len(self._alertas)
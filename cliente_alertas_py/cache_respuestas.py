@@ -0,0 +1,46 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+# Respuesta ya serializada y lista para servir varias veces
+class Entrada:
+    def __init__(self, cuerpo, encabezados, expira):
+        self.cuerpo = cuerpo
+        self.encabezados = encabezados
+        self.etag = hashlib.sha1(cuerpo).hexdigest()
+        self.expira = expira
+
+
+# Caché de respuestas de corta duración para los endpoints del dashboard
+# Con varios dashboards abiertos, todas las peticiones con la misma clave dentro del TTL
+# se responden con el mismo cuerpo (y el mismo ETag) sin volver a consultar al servidor final
+class CacheRespuestas:
+    def __init__(self, ttl=2.0, max_entradas=256):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    # producir() devuelve (cuerpo en bytes, dict de encabezados) y solo se llama si no hay
+    # una entrada vigente para la clave
+    def obtener(self, clave, producir):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada.expira > ahora:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada
+            self.fallos += 1
+        cuerpo, encabezados = producir()
+        entrada = Entrada(cuerpo, encabezados, time.monotonic() + self.ttl)
+        with self._lock:
+            self._entradas[clave] = entrada
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        return entrada
@@ -1,11 +1,19 @@
-from datetime import datetime as dt
+from datetime import datetime as dt, timedelta
 # datetime tiene un conflicto de nombre con si mismo? lol
+import os
+import sys
 import threading
 import time
-import requests
 import socket
 import json
-from flask import Flask, jsonify, render_template_string
+from flask import Flask, Response, g, jsonify, render_template_string, request
+# Módulos compartidos entre los servicios (paquete comun/ en la raíz del repositorio)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reglas import MotorReglas, cargar_reglas
+from almacen_alertas import AlmacenAlertas
+from cache_respuestas import CacheRespuestas
+from cliente_http import ClienteAPI
+from comun.metricas import REGISTRO, TIPO_CONTENIDO, Contador, Histograma, Medidor
 
 # --- CARGA DE CONFIGURACIÓN ---
 try:
@@ -16,17 +24,36 @@ except FileNotFoundError:
 
 # --- CONFIGURACIÓN ---
 API_URL = config["API_URL"]
-TEMP_MIN = config["TEMP_MIN"]
-TEMP_MAX = config["TEMP_MAX"]
-PRES_MIN = config["PRES_MIN"]
-PRES_MAX = config["PRES_MAX"]
-HUM_MIN = config["HUM_MIN"]
-HUM_MAX = config["HUM_MAX"]
+API_ULTIMAS_URL = config.get("API_ULTIMAS_URL", API_URL.replace("/api/mediciones", "/api/ultimas"))
+REGLAS, REGLAS_SENSORES = cargar_reglas(config)
 CONSULTA_INTERVALO = config["CONSULTA_INTERVALO"]
+LIMITE_CONSULTA = config.get("LIMITE_CONSULTA", 1000)  # filas por página del feed incremental
+MAX_ALERTAS = config.get("MAX_ALERTAS", 10000)  # alertas recientes que se guardan en memoria
+VENTANA_DEDUP_SEG = config.get("VENTANA_DEDUP_SEG", 300)  # una alerta igual no se repite antes de esto
+CACHE_TTL_SEG = config.get("CACHE_TTL_SEG", 2.0)  # vigencia de las respuestas del dashboard en caché
+MAX_FILAS_TABLA = 1000  # filas máximas por página de la tabla del dashboard
 
 # --- ESTADO DE ALERTAS GLOBAL ---
-alertas_activas = []
-alertas_ids = set()
+alertas = AlmacenAlertas(MAX_ALERTAS, VENTANA_DEDUP_SEG)
+ultimo_id = 0  # mayor id de medición ya revisado
+motor_reglas = MotorReglas(REGLAS, REGLAS_SENSORES)
+cache = CacheRespuestas(CACHE_TTL_SEG)
+api = ClienteAPI()  # sesión HTTP compartida por el hilo de consulta y los de Flask
+
+# --- MÉTRICAS (expuestas en /metrics) ---
+EVALUACION = Histograma("alertas_evaluacion_segundos", "Tiempo del motor de reglas por página de mediciones")
+MEDICIONES_EVALUADAS = Contador("alertas_mediciones_evaluadas_total", "Mediciones revisadas por el motor de reglas")
+ALERTAS = Contador("alertas_generadas_total", "Alertas del motor de reglas, registradas o suprimidas por repetidas",
+                   ("resultado",))
+CONSULTA_FINAL = Histograma("alertas_consulta_final_segundos", "Tiempo de cada consulta a la API del servidor final")
+ERRORES_CONSULTA = Contador("alertas_consulta_final_errores_total", "Consultas al servidor final que fallaron")
+API_SEGUNDOS = Histograma("alertas_api_segundos", "Tiempo de cada petición al dashboard", ("ruta",))
+Medidor("alertas_en_memoria", "Alertas guardadas en el almacén", funcion=lambda: len(alertas))
+Contador("alertas_peticiones_final_total", "Peticiones al servidor final según cómo se resolvieron", ("resultado",),
+         funcion=lambda: {("completa",): api.peticiones - api.no_modificadas, ("no_modificada",): api.no_modificadas,
+                          ("coalescida",): api.coalescidas})
+Contador("alertas_cache_respuestas_total", "Búsquedas en el caché de respuestas del dashboard", ("resultado",),
+         funcion=lambda: {("acierto",): cache.aciertos, ("fallo",): cache.fallos})
 
 # --- OBTENER IP ---
 # Código obtenido de stackoverflow, pregunta 166506
@@ -42,55 +69,41 @@ def obtener_ip_servidor():
         s.close()
     return IP
 
-# --- LÓGICA DE ALERTA ---
-def verificar_alertas(medicion):
-    alertas = []
-    if medicion["temperatura"] is None:
-        return alertas
-
-    if not (TEMP_MIN <= medicion["temperatura"] <= TEMP_MAX):
-        alertas.append(f"[{medicion['timestamp']}] Sensor {medicion['sensor_id']} - Temperatura fuera de rango: {medicion['temperatura']} °C")
-
-    if medicion["presion"] is None:
-        return alertas
-
-    if not (PRES_MIN <= medicion["presion"] <= PRES_MAX):
-        alertas.append(f"[{medicion['timestamp']}] Sensor {medicion['sensor_id']} - Presión fuera de rango: {medicion['presion']} hPa")
-
-    if medicion["humedad"] is None:
-        return alertas
-
-    if not (HUM_MIN <= medicion["humedad"] <= HUM_MAX):
-        alertas.append(f"[{medicion['timestamp']}] Sensor {medicion['sensor_id']} - Humedad fuera de rango: {medicion['humedad']} %")
-
-    return alertas
-
-def consultar_api():
+# Devuelve (datos, encabezados) de la API del servidor final, o ([], {}) si falla
+def consultar_api_respuesta(params=None, url=API_URL):
     try:
-        response = requests.get(API_URL, timeout=3)
-        response.raise_for_status()
-        return response.json()
+        with CONSULTA_FINAL.medir():
+            return api.obtener(url, params)
     except Exception as e:
+        ERRORES_CONSULTA.inc()
         print(f"[X] Error al consultar API: {e}")
-        return []
+        return [], {}
+
+def consultar_api(params=None, url=API_URL):
+    return consultar_api_respuesta(params, url)[0]
 
 def cliente_consulta():
-    global alertas_activas, alertas_ids
+    global ultimo_id
     print("[~] Cliente de consulta corriendo...")
     while True:
-        datos = consultar_api()
-        nuevas_alertas = []
-
-        for medicion in datos:
-            clave = (medicion["sensor_id"], medicion["timestamp"])
-            if clave not in alertas_ids:
-                resultado = verificar_alertas(medicion)
-                if resultado:
-                    nuevas_alertas.extend(resultado)
-                    alertas_ids.add(clave)
-
-        if nuevas_alertas:
-            alertas_activas.extend(nuevas_alertas)
+        # Solo se piden las mediciones nuevas desde la última consulta, página por página
+        # Un error en un ciclo no detiene al cliente: la página ya se dio por leída y se sigue
+        try:
+            while True:
+                datos = consultar_api({"after_id": ultimo_id, "limit": LIMITE_CONSULTA})
+                if datos:
+                    ultimo_id = max(ultimo_id, max(medicion["id"] for medicion in datos))
+
+                # la página completa se evalúa de una vez con el motor de reglas
+                with EVALUACION.medir():
+                    nuevas = motor_reglas.evaluar(datos)
+                MEDICIONES_EVALUADAS.inc(len(datos))
+                for alerta in nuevas:
+                    ALERTAS.inc(etiquetas=("registrada" if alertas.agregar(alerta) else "suprimida",))
+                if len(datos) < LIMITE_CONSULTA:
+                    break
+        except Exception as e:
+            print(f"[X] Error en el ciclo de consulta: {e}")
 
         time.sleep(CONSULTA_INTERVALO)
         print(f"Cliente disponible en {obtener_ip_servidor()}:9000")
@@ -98,6 +111,20 @@ def cliente_consulta():
 # --- SERVIDOR WEB ---
 app = Flask(__name__)
 
+@app.before_request
+def iniciar_cronometro():
+    g.inicio = time.perf_counter()
+
+@app.after_request
+def registrar_duracion(respuesta):
+    ruta = request.url_rule.rule if request.url_rule is not None else "otra"
+    API_SEGUNDOS.observar(time.perf_counter() - g.inicio, (ruta,))
+    return respuesta
+
+@app.route('/metrics')
+def metricas():
+    return Response(REGISTRO.exponer(), content_type=TIPO_CONTENIDO)
+
 @app.route('/')
 def home():
     html = """
@@ -174,7 +201,7 @@ def home():
                 alertas.slice().reverse().forEach(a => {
                     const div = document.createElement('div');
                     div.className = 'alerta';
-                    div.innerText = a;
+                    div.innerText = a.mensaje;
                     contenedor.appendChild(div);
                 });
             }
@@ -239,24 +266,28 @@ def home():
                 actualizarGraficas();
             }, 5000);
             
-            let datosTabla = [];
+            // la paginación la hace el servidor final con cursores; se guarda el de cada
+            // página visitada para poder volver atrás
+            let cursores = [null];
+            let siguiente = null;
             let pagina = 1;
             const porPagina = 10;
             
             async function cargarTabla() {
-                const res = await fetch('/api/tabla_mediciones');
-                datosTabla = await res.json();
-                renderizarTabla();
+                const params = new URLSearchParams({ limit: porPagina });
+                if (cursores[pagina - 1]) {
+                    params.set('cursor', cursores[pagina - 1]);
+                }
+                const res = await fetch('/api/tabla_mediciones?' + params);
+                const datos = await res.json();
+                siguiente = datos.siguiente;
+                renderizarTabla(datos.mediciones);
             }
             
-            function renderizarTabla() {
+            function renderizarTabla(paginaDatos) {
                 const tbody = document.querySelector("#tabla tbody");
                 tbody.innerHTML = '';
             
-                const inicio = (pagina - 1) * porPagina;
-                const fin = inicio + porPagina;
-                const paginaDatos = datosTabla.slice(inicio, fin);
-            
                 for (const fila of paginaDatos) {
                     const tr = document.createElement("tr");
                     tr.innerHTML = `
@@ -273,16 +304,17 @@ def home():
             }
             
             function paginaSiguiente() {
-                if ((pagina * porPagina) < datosTabla.length) {
+                if (siguiente) {
+                    cursores[pagina] = siguiente;
                     pagina++;
-                    renderizarTabla();
+                    cargarTabla();
                 }
             }
             
             function paginaAnterior() {
                 if (pagina > 1) {
                     pagina--;
-                    renderizarTabla();
+                    cargarTabla();
                 }
             }
 
@@ -297,29 +329,50 @@ def home():
     """
     return render_template_string(html)
 
+# Últimas alertas (20 por defecto), filtros opcionales sensor_id, severidad, since y limit
 @app.route('/api/alertas')
 def api_alertas():
-    return jsonify(alertas_activas[-20:])  # últimas 20 alertas
+    sensor_id = request.args.get('sensor_id', type=int)
+    limite = request.args.get('limit', 20, type=int)
+    return jsonify(alertas.consultar(sensor_id, request.args.get('severidad'), request.args.get('since'), limite))
+
+# Sirve una respuesta desde el caché con su ETag; si el navegador ya la tiene (If-None-Match)
+# se responde 304 sin cuerpo
+def respuesta_cacheada(clave, producir):
+    entrada = cache.obtener(clave, producir)
+    respuesta = Response(entrada.cuerpo, mimetype='application/json', headers=entrada.encabezados)
+    respuesta.set_etag(entrada.etag)
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta.make_conditional(request)
 
 @app.route('/api/ultimas_mediciones')
 def api_ultimas_mediciones():
-    datos = consultar_api()
-
-    sensores = {}
-    ahora = dt.now()
-
-    for d in datos:
-        ts = dt.strptime(d['timestamp'], "%Y-%m-%d %H:%M:%S")
+    def producir():
+        # el servidor final ya entrega solo la última medición de cada sensor
+        datos = consultar_api(url=API_ULTIMAS_URL)
         # Filtrar por sensores activos, 30s espera
-        if (ahora-ts).total_seconds()<=30:
-            sensores[d['sensor_id']] = d
+        # con el formato fijo "AAAA-MM-DD HH:MM:SS" basta comparar como texto
+        limite = (dt.now() - timedelta(seconds=30)).strftime("%Y-%m-%d %H:%M:%S")
+        activos = [d for d in datos if d['timestamp'] >= limite]
+        return json.dumps(activos).encode('utf-8'), {}
 
-    return jsonify(list(sensores.values()))
+    return respuesta_cacheada(('ultimas',), producir)
 
+# Una página del historial, ya ordenada de más reciente a más antigua por el servidor final
+# Parámetros limit, cursor, since, until y sensor_id se pasan tal cual a /api/mediciones
 @app.route('/api/tabla_mediciones')
 def api_tabla_mediciones():
-    datos = sorted(consultar_api(), key=lambda x: x['timestamp'], reverse=True) # Ordenar datos de mas recientes a mas antiguos
-    return jsonify(datos)
+    params = {'limit': max(1, min(request.args.get('limit', 10, type=int), MAX_FILAS_TABLA))}
+    for nombre in ('cursor', 'since', 'until', 'sensor_id'):
+        if request.args.get(nombre):
+            params[nombre] = request.args[nombre]
+
+    def producir():
+        datos, encabezados = consultar_api_respuesta(params)
+        pagina = {'mediciones': datos, 'siguiente': encabezados.get('X-Cursor-Siguiente')}
+        return json.dumps(pagina).encode('utf-8'), {}
+
+    return respuesta_cacheada(('tabla',) + tuple(sorted(params.items())), producir)
 
 # --- EJECUCIÓN ---
 if __name__ == "__main__":
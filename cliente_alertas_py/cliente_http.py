@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Consulta en curso a la que se suman los que piden lo mismo al mismo tiempo
+class Vuelo:
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+# Cliente HTTP compartido para la API del servidor final
+# - una sola sesión con pool de conexiones keep-alive y respuestas gzip
+# - peticiones condicionales: se recuerdan ETag/Last-Modified y el cuerpo de cada consulta
+#   (url + parámetros) y si el servidor responde 304 se reutiliza el cuerpo guardado
+# - los hilos que piden la misma consulta mientras ya hay una en curso esperan esa respuesta
+#   en vez de abrir otra petición
+class ClienteAPI:
+    def __init__(self, timeout=3, conexiones=10, max_entradas=64, max_bytes_entrada=1024 * 1024):
+        self.timeout = timeout
+        self.max_entradas = max_entradas
+        self.max_bytes_entrada = max_bytes_entrada  # cuerpos más grandes no se guardan para 304
+        self.sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=conexiones, pool_maxsize=conexiones)
+        self.sesion.mount("http://", adaptador)
+        self.sesion.mount("https://", adaptador)
+        self.sesion.headers["Accept-Encoding"] = "gzip"
+        self._validadas = OrderedDict()  # clave -> (etag, last-modified, datos, encabezados)
+        self._en_curso = {}  # clave -> Vuelo
+        self._lock = threading.Lock()
+        self.peticiones = 0
+        self.no_modificadas = 0
+        self.coalescidas = 0
+
+    # Devuelve (datos JSON, encabezados); lanza la excepción de requests si la consulta falla
+    # El resultado puede ser compartido con otros hilos y no se debe modificar
+    def obtener(self, url, params=None):
+        clave = (url, tuple(sorted((params or {}).items())))
+        with self._lock:
+            vuelo = self._en_curso.get(clave)
+            propio = vuelo is None
+            if propio:
+                vuelo = self._en_curso[clave] = Vuelo()
+            else:
+                self.coalescidas += 1
+        if not propio:
+            vuelo.listo.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado
+
+        try:
+            vuelo.resultado = self._consultar(clave, url, params)
+        except Exception as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._en_curso[clave]
+            vuelo.listo.set()
+        return vuelo.resultado
+
+    def _consultar(self, clave, url, params):
+        with self._lock:
+            guardada = self._validadas.get(clave)
+        encabezados = {}
+        if guardada is not None:
+            etag, modificado = guardada[0], guardada[1]
+            if etag:
+                encabezados["If-None-Match"] = etag
+            if modificado:
+                encabezados["If-Modified-Since"] = modificado
+
+        respuesta = self.sesion.get(url, params=params, headers=encabezados, timeout=self.timeout)
+        with self._lock:
+            self.peticiones += 1
+        if respuesta.status_code == 304 and guardada is not None:
+            with self._lock:
+                self.no_modificadas += 1
+                self._validadas.move_to_end(clave)
+            return guardada[2], guardada[3]
+        respuesta.raise_for_status()
+
+        datos = respuesta.json()
+        etag = respuesta.headers.get("ETag")
+        modificado = respuesta.headers.get("Last-Modified")
+        with self._lock:
+            if (etag or modificado) and len(respuesta.content) <= self.max_bytes_entrada:
+                self._validadas[clave] = (etag, modificado, datos, respuesta.headers)
+                self._validadas.move_to_end(clave)
+                while len(self._validadas) > self.max_entradas:
+                    self._validadas.popitem(last=False)
+            else:
+                self._validadas.pop(clave, None)
+        return datos, respuesta.headers
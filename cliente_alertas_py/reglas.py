@@ -0,0 +1,161 @@
+import numpy as np
+
+# campo en la medición, nombre para el mensaje, unidad
+METRICAS = (
+    ("temperatura", "Temperatura", "°C"),
+    ("presion", "Presión", "hPa"),
+    ("humedad", "Humedad", "%"),
+)
+SIN_TIEMPO = np.iinfo(np.int64).min  # NaT como entero
+
+
+# Reglas por defecto desde config.json
+# "REGLAS": {"temperatura": {"min": 21, "max": 29, "histeresis": 0.5, "cambio_max_por_min": 5}, ...}
+# "REGLAS_SENSORES": {"102": {"temperatura": {"max": 31}}} reemplaza solo los valores indicados
+# Sin "REGLAS" se usan los límites antiguos TEMP_MIN/TEMP_MAX, PRES_MIN/PRES_MAX y HUM_MIN/HUM_MAX
+def cargar_reglas(config):
+    reglas = config.get("REGLAS")
+    if reglas is None:
+        reglas = {
+            "temperatura": {"min": config["TEMP_MIN"], "max": config["TEMP_MAX"]},
+            "presion": {"min": config["PRES_MIN"], "max": config["PRES_MAX"]},
+            "humedad": {"min": config["HUM_MIN"], "max": config["HUM_MAX"]},
+        }
+    por_sensor = {int(sensor_id): r for sensor_id, r in config.get("REGLAS_SENSORES", {}).items()}
+    return reglas, por_sensor
+
+
+# Mantiene un estado que cambia solo con eventos: 1 donde hay activacion, 0 donde hay
+# desactivacion y el anterior en el resto. Las filas vienen agrupadas por sensor y cada grupo
+# parte desde inicial. Devuelve (estado de cada fila, estado anterior a cada fila)
+def _propagar(activacion, desactivacion, inicios, inicial):
+    eventos = np.where(activacion, 1, np.where(desactivacion, 0, -1)).astype(np.int8)
+    sin_evento = eventos[inicios] < 0
+    eventos[inicios[sin_evento]] = inicial[sin_evento]
+    posiciones = np.where(eventos >= 0, np.arange(len(eventos)), 0)
+    np.maximum.accumulate(posiciones, out=posiciones)
+    estado = eventos[posiciones]
+    anterior = np.empty_like(estado)
+    anterior[1:] = estado[:-1]
+    anterior[inicios] = inicial
+    return estado, anterior
+
+
+# Separa las mediciones cuyo timestamp no se puede leer, para que una fila mal formada no
+# impida evaluar el resto de la página. "0" (fecha inválida en el sensor) queda como NaT
+def _con_tiempo_valido(mediciones):
+    validas = []
+    tiempos = []
+    for medicion in mediciones:
+        try:
+            timestamp = medicion["timestamp"]
+            tiempos.append(np.datetime64("NaT" if timestamp == "0" else timestamp, "s"))
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"[X] Medición {medicion.get('id')} descartada, timestamp inválido: {e}")
+            continue
+        validas.append(medicion)
+    return validas, tiempos
+
+
+# Evalúa páginas completas de mediciones con operaciones de NumPy por columna
+# Cada métrica tiene límite alto/bajo con histéresis (la alerta sale al entrar fuera de rango
+# y no se repite hasta volver a min + histeresis / max - histeresis) y un cambio máximo por minuto
+# entre lecturas consecutivas del mismo sensor. El estado se conserva entre páginas
+class MotorReglas:
+    def __init__(self, reglas, reglas_sensores=None):
+        self.reglas = reglas
+        self.reglas_sensores = reglas_sensores or {}
+        # (sensor_id, campo) -> [alto, bajo, tiempo de la última lectura válida, último valor]
+        self.estado = {}
+
+    def regla(self, sensor_id, campo):
+        regla = dict(self.reglas.get(campo, {}))
+        regla.update(self.reglas_sensores.get(sensor_id, {}).get(campo, {}))
+        return regla
+
+    def _parametros(self, unicos, campo):
+        reglas = [self.regla(int(s), campo) for s in unicos]
+        def columna(nombre, defecto):
+            valores = [r.get(nombre) for r in reglas]
+            return np.array([defecto if v is None else v for v in valores], dtype=np.float64)
+        return columna("min", np.nan), columna("max", np.nan), columna("histeresis", 0.0), \
+            columna("cambio_max_por_min", np.nan)
+
+    # mediciones: lista de dicts del feed (id, sensor_id, timestamp, temperatura, presion, humedad)
+    # Devuelve las alertas nuevas en orden cronológico
+    def evaluar(self, mediciones):
+        mediciones, tiempos = _con_tiempo_valido(mediciones)
+        n = len(mediciones)
+        if not n:
+            return []
+        sensores = np.array([m["sensor_id"] for m in mediciones], dtype=np.int64)
+        tiempos = np.array(tiempos, dtype="datetime64[s]").astype(np.int64)
+        ids = np.array([m.get("id", 0) for m in mediciones], dtype=np.int64)
+        orden = np.lexsort((ids, tiempos, sensores))
+        sensores = sensores[orden]
+        tiempos = tiempos[orden]
+        tiempo_valido = tiempos != SIN_TIEMPO
+
+        unicos, grupo = np.unique(sensores, return_inverse=True)
+        inicios = np.flatnonzero(np.r_[True, sensores[1:] != sensores[:-1]])
+        finales = np.r_[inicios[1:] - 1, n - 1]
+        inicio_fila = inicios[grupo]
+        filas = np.arange(n)
+
+        alertas = []
+        for campo, nombre, unidad in METRICAS:
+            valores = np.array([m.get(campo) for m in mediciones], dtype=np.float64)[orden]
+            minimo, maximo, histeresis, cambio_max = (p[grupo] for p in self._parametros(unicos, campo))
+            estados = [self.estado.get((int(s), campo)) or [0, 0, None, None] for s in unicos]
+
+            # con NaN todas las comparaciones dan False: el estado se mantiene
+            alto, alto_antes = _propagar(valores > maximo, valores <= maximo - histeresis, inicios,
+                                         np.array([e[0] for e in estados], dtype=np.int8))
+            bajo, bajo_antes = _propagar(valores < minimo, valores >= minimo + histeresis, inicios,
+                                         np.array([e[1] for e in estados], dtype=np.int8))
+            fuera_de_rango = ((alto == 1) & (alto_antes == 0)) | ((bajo == 1) & (bajo_antes == 0))
+
+            # lectura válida anterior del mismo sensor (de esta página o del estado guardado)
+            valida = ~np.isnan(valores) & tiempo_valido
+            ultima_valida = np.where(valida, filas, -1)
+            np.maximum.accumulate(ultima_valida, out=ultima_valida)
+            previa = np.r_[-1, ultima_valida[:-1]]
+            en_pagina = previa >= inicio_fila
+            tiempo_guardado = np.array([SIN_TIEMPO if e[2] is None else e[2] for e in estados], dtype=np.int64)
+            valor_guardado = np.array([np.nan if e[3] is None else e[3] for e in estados], dtype=np.float64)
+            valor_previo = np.where(en_pagina, valores[previa], valor_guardado[grupo])
+            tiempo_previo = np.where(en_pagina, tiempos[previa], tiempo_guardado[grupo])
+            con_previa = valida & (tiempo_previo != SIN_TIEMPO)
+            transcurrido = np.where(con_previa, tiempos - np.where(con_previa, tiempo_previo, 0), 0)
+            delta = valores - valor_previo
+            # NaN en cambio_max (sin regla) nunca dispara
+            cambio_brusco = con_previa & (transcurrido > 0) & (np.abs(delta) * 60 > cambio_max * transcurrido)
+
+            for i in np.flatnonzero(fuera_de_rango | cambio_brusco):
+                medicion = mediciones[orden[i]]
+                encabezado = f"[{medicion['timestamp']}] Sensor {medicion['sensor_id']} - "
+                if fuera_de_rango[i]:
+                    alertas.append({
+                        "sensor_id": medicion["sensor_id"], "timestamp": medicion["timestamp"],
+                        "metrica": campo, "tipo": "alto" if alto[i] == 1 else "bajo", "valor": medicion[campo],
+                        "mensaje": encabezado + f"{nombre} fuera de rango: {medicion[campo]} {unidad}"
+                    })
+                if cambio_brusco[i]:
+                    alertas.append({
+                        "sensor_id": medicion["sensor_id"], "timestamp": medicion["timestamp"],
+                        "metrica": campo, "tipo": "cambio", "valor": medicion[campo],
+                        "mensaje": encabezado + f"{nombre} cambió {delta[i]:+.2f} {unidad} en {int(transcurrido[i])} s"
+                    })
+
+            # estado al final de la página para la siguiente
+            for g, fin in enumerate(finales):
+                estado = estados[g]
+                estado[0] = int(alto[fin])
+                estado[1] = int(bajo[fin])
+                if ultima_valida[fin] >= inicios[g]:
+                    estado[2] = int(tiempos[ultima_valida[fin]])
+                    estado[3] = float(valores[ultima_valida[fin]])
+                self.estado[(int(unicos[g]), campo)] = estado
+
+        alertas.sort(key=lambda a: (a["timestamp"], a["sensor_id"]))
+        return alertas
@@ -0,0 +1,74 @@
+from comun.protocolo import LARGO, MAX_TRAMA
+
+TAM_LECTURA = 256 * 1024  # bytes por recv_into
+MAX_LINEA = 1024 * 1024  # una línea más larga que esto cierra la conexión
+
+
+# Separa mensajes de un socket TCP sin copiar el buffer completo por cada mensaje
+# Los bytes se reciben con recv_into en un bloque reutilizado y se agregan a un bytearray;
+# los mensajes se extraen avanzando un índice y lo ya consumido se descarta en bloque,
+# así una ráfaga de muchas líneas cuesta tiempo lineal y no cuadrático.
+# Sirve para líneas terminadas en \n, tramas con largo u32 y paquetes de tamaño fijo
+class LectorSocket:
+    def __init__(self, conex, tam_lectura=TAM_LECTURA, max_linea=MAX_LINEA):
+        self.conex = conex
+        self.max_linea = max_linea
+        self._bloque = memoryview(bytearray(tam_lectura))
+        self._buffer = bytearray()
+        self._inicio = 0  # primer byte sin consumir
+        self._busqueda = 0  # hasta aquí ya se buscó un \n sin encontrarlo
+        self.bytes_recibidos = 0
+
+    def pendientes(self):
+        return len(self._buffer) - self._inicio
+
+    # Una lectura del socket; devuelve los bytes recibidos (0 si el otro lado cerró)
+    def recibir(self):
+        n = self.conex.recv_into(self._bloque)
+        if n:
+            if self._inicio:
+                del self._buffer[:self._inicio]
+                self._busqueda = max(0, self._busqueda - self._inicio)
+                self._inicio = 0
+            self._buffer += self._bloque[:n]
+            self.bytes_recibidos += n
+        return n
+
+    # Siguiente línea completa sin el \n, o None si todavía no llega entera
+    def linea(self):
+        fin = self._buffer.find(b'\n', max(self._inicio, self._busqueda))
+        if fin < 0:
+            self._busqueda = len(self._buffer)
+            if self.pendientes() > self.max_linea:
+                raise ValueError(f"línea de más de {self.max_linea} bytes")
+            return None
+        linea = bytes(self._buffer[self._inicio:fin])
+        self._inicio = fin + 1
+        return linea
+
+    # Siguiente cuerpo de trama (largo u32 + cuerpo) completo, o None
+    def trama(self, maximo=MAX_TRAMA):
+        if self.pendientes() < LARGO.size:
+            return None
+        largo, = LARGO.unpack_from(self._buffer, self._inicio)
+        if largo > maximo:
+            raise ValueError(f"trama binaria demasiado grande: {largo} bytes")
+        if self.pendientes() < LARGO.size + largo:
+            return None
+        self._inicio += LARGO.size
+        return self.exacto(largo)
+
+    # Los siguientes n bytes si ya llegaron, o None
+    def exacto(self, n):
+        if self.pendientes() < n:
+            return None
+        datos = bytes(self._buffer[self._inicio:self._inicio + n])
+        self._inicio += n
+        return datos
+
+    # Bloquea hasta tener n bytes; None si la conexión se cierra antes
+    def leer_exacto(self, n):
+        while self.pendientes() < n:
+            if not self.recibir():
+                return None
+        return self.exacto(n)
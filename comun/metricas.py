@@ -0,0 +1,173 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+BUCKETS_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CANTIDAD = (1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+
+# Conjunto de métricas que se exponen juntas en /metrics
+class Registro:
+    def __init__(self):
+        self._metricas = []
+        self._lock = threading.Lock()
+
+    def agregar(self, metrica):
+        with self._lock:
+            self._metricas.append(metrica)
+
+    # Texto en el formato de exposición de Prometheus
+    def exponer(self):
+        with self._lock:
+            metricas = list(self._metricas)
+        lineas = []
+        for metrica in metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.muestras())
+        return "\n".join(lineas) + "\n"
+
+REGISTRO = Registro()
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _etiquetas(nombres, valores, extra=()):
+    pares = list(zip(nombres, valores)) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + "}"
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+# Base de contadores y medidores: un valor por combinación de etiquetas
+# Con funcion, el valor se lee al exponer (para contadores que ya lleva otro objeto);
+# funcion devuelve un número o, si hay etiquetas, un dict {tupla de valores: número}
+class Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), funcion=None, registro=REGISTRO):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.funcion = funcion
+        self._valores = {}
+        self._lock = threading.Lock()
+        registro.agregar(self)
+
+    def _sumar(self, cantidad, etiquetas):
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + cantidad
+
+    def valor(self, etiquetas=()):
+        with self._lock:
+            return self._valores.get(tuple(etiquetas), 0)
+
+    def muestras(self):
+        if self.funcion is not None:
+            valores = self.funcion()
+            if not isinstance(valores, dict):
+                valores = {(): valores}
+        else:
+            with self._lock:
+                valores = dict(self._valores)
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {_numero(valor)}"
+                for etiquetas, valor in sorted(valores.items())]
+
+
+class Contador(Metrica):
+    tipo = "counter"
+
+    def inc(self, cantidad=1, etiquetas=()):
+        self._sumar(cantidad, tuple(etiquetas))
+
+
+class Medidor(Metrica):
+    tipo = "gauge"
+
+    def set(self, valor, etiquetas=()):
+        with self._lock:
+            self._valores[tuple(etiquetas)] = valor
+
+    def inc(self, cantidad=1, etiquetas=()):
+        self._sumar(cantidad, tuple(etiquetas))
+
+    def dec(self, cantidad=1, etiquetas=()):
+        self._sumar(-cantidad, tuple(etiquetas))
+
+
+# Distribución de valores (duraciones, tamaños) en buckets acumulados
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS, registro=REGISTRO):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # etiquetas -> [conteo por bucket (el último es +Inf), suma]
+        self._lock = threading.Lock()
+        registro.agregar(self)
+
+    def observar(self, valor, etiquetas=()):
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(tuple(etiquetas))
+            if serie is None:
+                serie = self._series[tuple(etiquetas)] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += valor
+
+    # with histograma.medir(): ... observa los segundos que tarda el bloque
+    @contextmanager
+    def medir(self, etiquetas=()):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, etiquetas)
+
+    def muestras(self):
+        with self._lock:
+            series = {etiquetas: (list(conteos), suma) for etiquetas, (conteos, suma) in self._series.items()}
+        lineas = []
+        for etiquetas, (conteos, suma) in sorted(series.items()):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float("inf"),), conteos):
+                acumulado += conteo
+                le = _etiquetas(self.etiquetas, etiquetas, [("le", _numero(limite))])
+                lineas.append(f"{self.nombre}_bucket{le} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, etiquetas)} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, etiquetas)} {acumulado}")
+        return lineas
+
+
+# Servidor HTTP mínimo con solo /metrics, para los procesos que no tienen Flask
+def iniciar_servidor_metricas(host, puerto, registro=REGISTRO):
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            cuerpo = registro.exponer().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", TIPO_CONTENIDO)
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, formato, *args):
+            pass
+
+    servidor = ThreadingHTTPServer((host, puerto), Manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True, name="metricas").start()
+    return servidor
@@ -0,0 +1,86 @@
+import json
+import struct
+
+# Formato binario del enlace intermedio -> final (versión 1)
+#
+# Negociación: al conectar, el intermedio envía la línea "HOLA bin1,json\n" y el final
+# responde "FORMATO bin1\n" o "FORMATO json\n". Un servidor final que no entiende HOLA
+# cierra la conexión y el intermedio vuelve a conectar usando líneas JSON.
+#
+# Trama bin1: largo u32 del cuerpo, seguido del cuerpo:
+#   versión u8 | tipo u8 | cantidad u32 | largo_firma u16 | registros | firma
+# Cada registro es el mismo struct SensorData del sensor ('<hQfff', 22 bytes) con la fecha
+# como entero AAAAMMDDHHMMSS (0 si era inválida). La firma RSA cubre todo el cuerpo salvo la firma.
+# Las respuestas siguen siendo líneas: OK, RECHAZADO o ERROR.
+
+VERSION_BINARIA = 1
+TIPO_LOTE = 1
+FORMATO_BINARIO = "bin1"
+FORMATO_JSON = "json"
+SALUDO = b"HOLA " + FORMATO_BINARIO.encode() + b"," + FORMATO_JSON.encode() + b"\n"
+
+LARGO = struct.Struct('<I')
+CABECERA = struct.Struct('<BBIH')
+REGISTRO = struct.Struct('<hQfff')
+MAX_TRAMA = 16 * 1024 * 1024
+
+
+def timestamp_a_entero(timestamp):
+    digitos = timestamp.replace('-', '').replace(' ', '').replace(':', '')
+    return int(digitos) if len(digitos) == 14 and digitos.isdigit() else 0
+
+
+def entero_a_timestamp(valor):
+    if not valor:
+        return "0"
+    s = str(valor)
+    return f"{s[0:4]}-{s[4:6]}-{s[6:8]} {s[8:10]}:{s[10:12]}:{s[12:14]}"
+
+
+# dict de medición -> 22 bytes
+def empaquetar_medicion(datos):
+    return REGISTRO.pack(datos["id"], timestamp_a_entero(datos["timestamp"]),
+                         datos["temperatura"], datos["presion"], datos["humedad"])
+
+
+# Registros guardados en el spool; los anteriores al formato binario eran JSON
+def desempaquetar_medicion(datos):
+    if len(datos) != REGISTRO.size:
+        return json.loads(bytes(datos).decode('utf-8'))
+    return desempaquetar_registros(datos)[0]
+
+
+def desempaquetar_registros(registros):
+    return [
+        {
+            "id": id,
+            "timestamp": entero_a_timestamp(fecha),
+            "temperatura": temp,
+            "presion": pres,
+            "humedad": hum
+        }
+        for id, fecha, temp, pres, hum in REGISTRO.iter_unpack(registros)
+    ]
+
+
+# Cuerpo bin1 de un lote sin la firma, que es justamente lo que se firma
+def cuerpo_lote(lote, largo_firma):
+    return CABECERA.pack(VERSION_BINARIA, TIPO_LOTE, len(lote), largo_firma) + \
+        b"".join(empaquetar_medicion(datos) for datos in lote)
+
+
+def trama(cuerpo_firmado, firma):
+    cuerpo = cuerpo_firmado + firma
+    return LARGO.pack(len(cuerpo)) + cuerpo
+
+
+# Separa un cuerpo bin1 en (datos firmados, firma, mediciones); lanza ValueError si está mal formado
+def leer_cuerpo(cuerpo):
+    version, tipo, cantidad, largo_firma = CABECERA.unpack_from(cuerpo)
+    if version != VERSION_BINARIA or tipo != TIPO_LOTE:
+        raise ValueError(f"trama binaria no soportada: version {version}, tipo {tipo}")
+    fin_registros = CABECERA.size + cantidad * REGISTRO.size
+    if fin_registros + largo_firma != len(cuerpo):
+        raise ValueError("largo de trama binaria inconsistente")
+    firmado = cuerpo[:fin_registros]
+    return firmado, cuerpo[fin_registros:], desempaquetar_registros(cuerpo[CABECERA.size:fin_registros])
@@ -1,62 +1,506 @@
 import sqlite3
-import base64
-import json
+import calendar
+import heapq
+import logging
+import queue
+import re
+import threading
+import time
 from datetime import datetime
+from itertools import islice
+from comun.metricas import Histograma, BUCKETS_CANTIDAD
 
 BASEDATOS = 'database.db'
+TAM_LOTE_ESCRITURA = 5000  # filas máximas por commit
+ESPERA_LOTE_ESCRITURA_MS = 20  # tiempo máximo que se acumulan filas antes de hacer commit
+RETENCION_MESES = None  # meses completos de datos crudos que se conservan además del actual, None = todo
+REVISION_RETENCION_SEG = 3600  # cada cuanto el escritor revisa si hay particiones vencidas
 
-def inicializar_db():
-    conex = sqlite3.connect(BASEDATOS)
-    c = conex.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS mediciones (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+log = logging.getLogger(__name__)
+
+LOTE_FILAS = Histograma("final_db_lote_filas", "Filas por commit del escritor", buckets=BUCKETS_CANTIDAD)
+COMMIT_SEGUNDOS = Histograma("final_db_commit_segundos",
+                             "Duración de cada commit del escritor (filas crudas y agregados)")
+
+# Las mediciones crudas se guardan en una tabla por mes (mediciones_AAAAMM) con el timestamp
+# como entero: segundos desde 1970 de la hora del sensor tomada tal cual (sin zona horaria),
+# 0 si la fecha era inválida. La retención elimina meses completos con DROP TABLE.
+# Los id son globales y crecientes entre particiones; el último asignado se guarda en secuencias
+FORMATO_TIMESTAMP = "%Y-%m-%d %H:%M:%S"
+EPOCA = datetime(1970, 1, 1)
+PATRON_PARTICION = re.compile(r'^mediciones_(\d{4})(\d{2})$')
+
+# "AAAA-MM-DD HH:MM:SS" -> entero; lanza ValueError si no es una fecha válida
+def texto_a_epoch(timestamp):
+    return int((datetime.fromisoformat(timestamp) - EPOCA).total_seconds())
+
+def epoch_a_texto(epoch):
+    if not epoch:
+        return "0"
+    return time.strftime(FORMATO_TIMESTAMP, time.gmtime(epoch))
+
+def particion_de(epoch):
+    fecha = time.gmtime(epoch)
+    return f"mediciones_{fecha.tm_year:04d}{fecha.tm_mon:02d}"
+
+# Rango [inicio, fin) en epoch que cubre una partición
+def rango_particion(nombre):
+    anio, mes = (int(x) for x in PATRON_PARTICION.match(nombre).groups())
+    siguiente = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+    return calendar.timegm((anio, mes, 1, 0, 0, 0)), calendar.timegm(siguiente + (1, 0, 0, 0))
+
+# Particiones existentes en orden cronológico, solo las que pueden tener filas entre desde y hasta
+def particiones(conex, desde=None, hasta=None):
+    nombres = sorted(
+        nombre for nombre, in conex.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        if PATRON_PARTICION.match(nombre))
+    resultado = []
+    for nombre in nombres:
+        inicio, fin = rango_particion(nombre)
+        if (desde is None or fin > desde) and (hasta is None or inicio <= hasta):
+            resultado.append(nombre)
+    return resultado
+
+def crear_particion(conex, nombre):
+    conex.execute(f'''
+        CREATE TABLE IF NOT EXISTS {nombre} (
+            id INTEGER PRIMARY KEY,
             sensor_id INTEGER NOT NULL,
-            timestamp TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
             temperatura REAL,
             presion REAL,
             humedad REAL,
             UNIQUE(sensor_id, timestamp)
         )
     ''')
+    # UNIQUE(sensor_id, timestamp) ya sirve de índice para consultas por sensor;
+    # este cubre las consultas por rango de tiempo sin filtrar sensor
+    conex.execute(f'CREATE INDEX IF NOT EXISTS idx_{nombre}_timestamp ON {nombre}(timestamp)')
+
+# Primer instante que se conserva según RETENCION_MESES, o None si se conserva todo
+# Se usa la hora local como si fuera UTC, igual que los timestamps de los sensores
+def inicio_retencion(meses=RETENCION_MESES):
+    if meses is None:
+        return None
+    ahora = time.localtime()
+    total = ahora.tm_year * 12 + ahora.tm_mon - 1 - meses
+    return calendar.timegm((total // 12, total % 12 + 1, 1, 0, 0, 0))
+
+# Tablas de agregados por intervalo: mínimo, máximo, suma y cantidad de cada métrica por
+# sensor, para graficar rangos largos sin leer las filas crudas. No les afecta la retención
+# resolución -> (tabla, segundos del intervalo)
+RESOLUCIONES = {
+    '1m': ('mediciones_1m', 60),
+    '1h': ('mediciones_1h', 3600),
+    '1d': ('mediciones_1d', 86400),
+}
+METRICAS = ('temperatura', 'presion', 'humedad')
+
+# Inicio del intervalo al que pertenece un timestamp, o None si es inválido
+def inicio_intervalo(epoch, resolucion):
+    if epoch <= 0:
+        return None
+    return epoch - epoch % RESOLUCIONES[resolucion][1]
+
+def crear_agregados(c):
+    columnas = ''.join(
+        f'{m}_min REAL, {m}_max REAL, {m}_suma REAL NOT NULL DEFAULT 0, {m}_cantidad INTEGER NOT NULL DEFAULT 0,'
+        for m in METRICAS)
+    anterior = None
+    for resolucion, (tabla, segundos) in RESOLUCIONES.items():
+        existia = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabla,)).fetchone()
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {tabla} (
+                sensor_id INTEGER NOT NULL,
+                intervalo INTEGER NOT NULL,
+                {columnas}
+                PRIMARY KEY (sensor_id, intervalo)
+            )
+        ''')
+        c.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabla}_intervalo ON {tabla}(intervalo)')
+        if existia:
+            anterior = tabla
+            continue
+        # tabla nueva sobre una base con datos: se llena desde la resolución anterior
+        # (o desde las particiones crudas para la primera; ningún intervalo cruza de mes)
+        if anterior is None:
+            agregados = ', '.join(f'MIN({m}), MAX({m}), TOTAL({m}), COUNT({m})' for m in METRICAS)
+            for particion in particiones(c):
+                c.execute(f'INSERT INTO {tabla} SELECT sensor_id, timestamp - timestamp % {segundos}, {agregados} '
+                          f'FROM {particion} WHERE timestamp > 0 GROUP BY 1, 2')
+        else:
+            agregados = ', '.join(f'MIN({m}_min), MAX({m}_max), TOTAL({m}_suma), TOTAL({m}_cantidad)' for m in METRICAS)
+            c.execute(f'INSERT INTO {tabla} SELECT sensor_id, intervalo - intervalo % {segundos}, {agregados} '
+                      f'FROM {anterior} GROUP BY 1, 2')
+        anterior = tabla
+
+# Suma al agregado de cada intervalo las filas recién insertadas
+# filas son tuplas (id, sensor_id, timestamp, temperatura, presion, humedad)
+def actualizar_agregados(conex, filas):
+    for resolucion, (tabla, _) in RESOLUCIONES.items():
+        grupos = {}
+        for fila in filas:
+            intervalo = inicio_intervalo(fila[2], resolucion)
+            if intervalo is None:
+                continue
+            grupo = grupos.get((fila[1], intervalo))
+            if grupo is None:
+                grupo = grupos[(fila[1], intervalo)] = [None, None, 0.0, 0] * len(METRICAS)
+            for i, valor in enumerate(fila[3:6]):
+                if valor is None:
+                    continue
+                base = i * 4
+                grupo[base] = valor if grupo[base] is None else min(grupo[base], valor)
+                grupo[base + 1] = valor if grupo[base + 1] is None else max(grupo[base + 1], valor)
+                grupo[base + 2] += valor
+                grupo[base + 3] += 1
+        if not grupos:
+            continue
+        actualizacion = ', '.join(
+            f'{m}_min = MIN(COALESCE({m}_min, excluded.{m}_min), COALESCE(excluded.{m}_min, {m}_min)), '
+            f'{m}_max = MAX(COALESCE({m}_max, excluded.{m}_max), COALESCE(excluded.{m}_max, {m}_max)), '
+            f'{m}_suma = {m}_suma + excluded.{m}_suma, '
+            f'{m}_cantidad = {m}_cantidad + excluded.{m}_cantidad'
+            for m in METRICAS)
+        conex.executemany(
+            f'INSERT INTO {tabla} VALUES ({", ".join("?" * (2 + 4 * len(METRICAS)))}) '
+            f'ON CONFLICT(sensor_id, intervalo) DO UPDATE SET {actualizacion}',
+            [clave + tuple(grupo) for clave, grupo in grupos.items()])
+
+# Pasa la tabla única con timestamps de texto a particiones mensuales, conservando los id
+# Los agregados se reconstruyen porque estaban indexados por texto
+def migrar_tabla_unica(c):
+    log.info("Migrando tabla mediciones a particiones mensuales")
+    fila = c.execute("SELECT seq FROM sqlite_sequence WHERE name = 'mediciones'").fetchone()
+    ultimo_id = max(fila[0] if fila else 0, c.execute('SELECT COALESCE(MAX(id), 0) FROM mediciones').fetchone()[0])
+    # el intermedio manda "0" cuando la fecha del sensor era inválida
+    epoch = "COALESCE(CASE WHEN length(timestamp) = 19 THEN CAST(strftime('%s', timestamp) AS INTEGER) END, 0)"
+    mes = "COALESCE(CASE WHEN length(timestamp) = 19 THEN strftime('%Y%m', timestamp) END, '197001')"
+    for mes_particion, in c.execute(f'SELECT DISTINCT {mes} FROM mediciones').fetchall():
+        nombre = f"mediciones_{mes_particion}"
+        crear_particion(c, nombre)
+        c.execute(f'''
+            INSERT OR IGNORE INTO {nombre}
+            SELECT id, sensor_id, {epoch}, temperatura, presion, humedad FROM mediciones WHERE {mes} = ?
+        ''', (mes_particion,))
+    c.execute("INSERT OR REPLACE INTO secuencias VALUES ('mediciones', ?)", (ultimo_id,))
+    c.execute('DROP TABLE mediciones')
+    for tabla, _ in RESOLUCIONES.values():
+        c.execute(f'DROP TABLE IF EXISTS {tabla}')
+
+def inicializar_db():
+    conex = sqlite3.connect(BASEDATOS)
+    c = conex.cursor()
+    c.execute('CREATE TABLE IF NOT EXISTS secuencias (nombre TEXT PRIMARY KEY, valor INTEGER NOT NULL)')
+    if c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'mediciones'").fetchone():
+        migrar_tabla_unica(c)
+    crear_agregados(c)
     conex.commit()
     conex.close()
 
-def insertar_medicion(json_crudo):
+# Arma el WHERE de una consulta paginada por (timestamp, id) descendente
+# cursor es la tupla (timestamp, id) de la última fila de la página anterior
+def filtros_mediciones(sensor_id=None, desde=None, hasta=None, cursor=None, columna='timestamp'):
+    condiciones = []
+    parametros = []
+    if sensor_id is not None:
+        condiciones.append('sensor_id = ?')
+        parametros.append(sensor_id)
+    if desde is not None:
+        condiciones.append(f'{columna} >= ?')
+        parametros.append(desde)
+    if hasta is not None:
+        condiciones.append(f'{columna} <= ?')
+        parametros.append(hasta)
+    if cursor is not None:
+        # el {columna} <= ? suelto es el que deja a SQLite saltar por el índice hasta el cursor
+        condiciones.append(f'{columna} <= ? AND ({columna} < ? OR id < ?)')
+        parametros.extend([cursor[0], cursor[0], cursor[1]])
+    where = (' WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+    return where, parametros
+
+# Recorre las particiones de la más nueva a la más antigua; como no se solapan en el tiempo,
+# concatenar cada una ordenada da el orden global (timestamp, id) descendente
+def recorrer_particiones(columnas, sensor_id=None, desde=None, hasta=None, limite=None, cursor=None):
+    conex = sqlite3.connect(BASEDATOS)
     try:
-        # Decodificar JSON desde base64
-        json_decodificado = base64.b64decode(json_crudo.encode('utf-8')).decode('utf-8')
-        datos = json.loads(json_decodificado)
-        assert "id" in datos and "timestamp" in datos # Validación
+        tope = hasta if cursor is None or (hasta is not None and hasta < cursor[0]) else cursor[0]
+        restantes = limite
+        for particion in reversed(particiones(conex, desde, tope)):
+            where, parametros = filtros_mediciones(sensor_id, desde, hasta, cursor)
+            consulta = f'SELECT {columnas} FROM {particion}' + where + ' ORDER BY timestamp DESC, id DESC'
+            if restantes is not None:
+                consulta += ' LIMIT ?'
+                parametros.append(restantes)
+            for fila in conex.execute(consulta, parametros):
+                yield fila
+                if restantes is not None:
+                    restantes -= 1
+            if restantes == 0:
+                return
+    finally:
+        conex.close()
 
-    except Exception as e:
-        print("Error procesando paquete: ", e)
-        return
+# Recorre las mediciones de más reciente a más antigua sin cargarlas todas en memoria
+# desde, hasta y el timestamp del cursor son enteros epoch
+def iterar_mediciones(sensor_id=None, desde=None, hasta=None, limite=None, cursor=None):
+    return recorrer_particiones('*', sensor_id, desde, hasta, limite, cursor)
 
+# Feed incremental: mediciones con id mayor a despues_de_id en orden de inserción
+# Como hay un solo escritor, los id se hacen visibles en orden y nunca aparece uno menor después.
+# Una medición atrasada puede caer en una partición antigua, por eso se mezclan todas por id
+def iterar_mediciones_nuevas(despues_de_id, limite, sensor_id=None):
+    consulta = 'WHERE id > ?'
+    parametros = [despues_de_id]
+    if sensor_id is not None:
+        consulta += ' AND sensor_id = ?'
+        parametros.append(sensor_id)
+    consulta += ' ORDER BY id LIMIT ?'
+    parametros.append(limite)
+    conex = sqlite3.connect(BASEDATOS)
     try:
-        conex = sqlite3.connect(BASEDATOS)
-        cursor = conex.cursor()
-        cursor.execute('''
-            INSERT OR IGNORE INTO mediciones (sensor_id, timestamp, temperatura, presion, humedad)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (datos['id'], datos['timestamp'], datos['temperatura'], datos['presion'], datos['humedad']))
-        conex.commit()
-
-        if cursor.rowcount == 0:
-            print("Dato duplicado ignorado: ", datos)
-        else:
-            print("Dato insertado: ", datos)
-
-    except Exception as e:
-        print("Error con base de datos:", e)
+        cursores = [conex.execute(f'SELECT * FROM {p} ' + consulta, parametros) for p in particiones(conex)]
+        for fila in islice(heapq.merge(*cursores), limite):
+            yield fila
+    finally:
+        conex.close()
 
+# Última medición de cada sensor, para precargar el caché de últimos valores al iniciar
+def obtener_ultimas_mediciones():
+    conex = sqlite3.connect(BASEDATOS)
+    try:
+        ultimas = {}
+        for particion in reversed(particiones(conex)):
+            for fila in conex.execute(f'''
+                SELECT m.* FROM {particion} m
+                JOIN (SELECT sensor_id, MAX(timestamp) AS ts FROM {particion} GROUP BY sensor_id) u
+                  ON m.sensor_id = u.sensor_id AND m.timestamp = u.ts
+            '''):
+                ultimas.setdefault(fila[1], fila)
+        return list(ultimas.values())
     finally:
         conex.close()
 
-def obtener_mediciones():
+# Agregados de una resolución en orden cronológico; desde/hasta filtran por inicio del intervalo
+def iterar_agregados(resolucion, sensor_id=None, desde=None, hasta=None, limite=None):
+    tabla = RESOLUCIONES[resolucion][0]
+    where, parametros = filtros_mediciones(sensor_id, desde, hasta, columna='intervalo')
+    consulta = f'SELECT * FROM {tabla}' + where + ' ORDER BY intervalo, sensor_id'
+    if limite is not None:
+        consulta += ' LIMIT ?'
+        parametros.append(limite)
     conex = sqlite3.connect(BASEDATOS)
-    c = conex.cursor()
-    c.execute('SELECT * FROM mediciones ORDER BY timestamp DESC')
-    filas = c.fetchall()
-    conex.close()
-    return filas
+    try:
+        for fila in conex.execute(consulta, parametros):
+            yield fila
+    finally:
+        conex.close()
+
+def obtener_mediciones(sensor_id=None, desde=None, hasta=None, limite=None, cursor=None):
+    return list(iterar_mediciones(sensor_id, desde, hasta, limite, cursor))
+
+# Aviso de que un grupo de mediciones encoladas ya quedó guardado (o falló)
+class Confirmacion:
+    def __init__(self):
+        self._evento = threading.Event()
+        self.ok = False
+
+    def completar(self, ok):
+        self.ok = ok
+        self._evento.set()
+
+    def esperar(self, timeout=None):
+        return self._evento.wait(timeout) and self.ok
+
+
+# Hilo escritor único de la base de datos
+# Es dueño de la única conexión de escritura (modo WAL) y agrupa las mediciones
+# encoladas en commits de hasta TAM_LOTE_ESCRITURA filas o ESPERA_LOTE_ESCRITURA_MS.
+# También asigna los id y elimina las particiones que quedan fuera de la retención
+class EscritorMediciones(threading.Thread):
+    def __init__(self, ruta=BASEDATOS, tam_lote=TAM_LOTE_ESCRITURA, espera_ms=ESPERA_LOTE_ESCRITURA_MS,
+                 retencion_meses=RETENCION_MESES):
+        super().__init__(daemon=True, name="escritor-db")
+        self.ruta = ruta
+        self.tam_lote = tam_lote
+        self.espera_ms = espera_ms
+        self.retencion_meses = retencion_meses
+        self.cola = queue.Queue()
+        self.ultimo_lote = {}
+        self.total_insertadas = 0
+        self.total_duplicadas = 0
+        self.total_vencidas = 0
+        self.lotes = 0
+        self.ultimo_id = 0
+        # versión de los datos para los validadores HTTP: cambia con cada commit que inserta
+        # filas o elimina particiones; el instante de arranque la distingue entre reinicios
+        self.arranque = int(time.time())
+        self.version = 0
+        self.ultima_escritura = time.time()
+        self._particiones = set()
+        self._limite_retencion = None
+        self._proxima_retencion = 0.0
+        self._suscriptores = []
+
+    # funcion(filas) se llama desde el hilo escritor después de cada commit con las filas
+    # realmente insertadas, como tuplas (id, sensor_id, timestamp, temperatura, presion, humedad)
+    # con el timestamp como entero epoch
+    def suscribir(self, funcion):
+        self._suscriptores.append(funcion)
+
+    # Encola mediciones ya decodificadas (dicts con id, timestamp, temperatura, presion, humedad)
+    def encolar(self, mediciones):
+        confirmacion = Confirmacion()
+        filas = []
+        for datos in mediciones:
+            if "id" not in datos or "timestamp" not in datos:  # Validación
+                log.warning("Error procesando paquete: %s", datos)
+                continue
+            try:
+                timestamp = texto_a_epoch(datos['timestamp'])
+            except (TypeError, ValueError):
+                timestamp = 0
+            filas.append((datos['id'], timestamp, datos.get('temperatura'),
+                          datos.get('presion'), datos.get('humedad')))
+        if filas:
+            self.cola.put((filas, confirmacion))
+        else:
+            confirmacion.completar(True)
+        return confirmacion
+
+    # Espera hasta timeout segundos por el primer grupo (None = sin límite); [] si no llegó nada
+    def tomar_grupo(self, timeout=None):
+        try:
+            grupo = [self.cola.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        total = len(grupo[0][0])
+        limite = time.monotonic() + self.espera_ms / 1000
+        while total < self.tam_lote:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                item = self.cola.get(timeout=restante)
+            except queue.Empty:
+                break
+            grupo.append(item)
+            total += len(item[0])
+        return grupo
+
+    # Elimina las particiones anteriores al inicio de la retención, un DROP TABLE por mes
+    def aplicar_retencion(self, conex):
+        self._limite_retencion = inicio_retencion(self.retencion_meses)
+        self._proxima_retencion = time.monotonic() + REVISION_RETENCION_SEG
+        if self._limite_retencion is None:
+            return
+        for particion in particiones(conex):
+            if rango_particion(particion)[1] <= self._limite_retencion:
+                with conex:
+                    conex.execute(f'DROP TABLE {particion}')
+                self._particiones.discard(particion)
+                self.marcar_cambio()
+                log.info("Partición %s eliminada por retención", particion)
+
+    def marcar_cambio(self):
+        self.ultima_escritura = time.time()
+        self.version += 1
+
+    # Inserta las filas en sus particiones asignándoles id; devuelve las realmente insertadas
+    # (en orden de id), el último id asignado y cuántas se saltaron por estar fuera de la retención
+    def insertar(self, conex, filas):
+        siguiente = self.ultimo_id
+        por_particion = {}
+        vencidas = 0
+        for fila in filas:
+            if self._limite_retencion is not None and fila[1] < self._limite_retencion:
+                vencidas += 1
+                continue
+            siguiente += 1
+            por_particion.setdefault(particion_de(fila[1]), []).append((siguiente,) + fila)
+        nuevas = []
+        for particion, filas_particion in por_particion.items():
+            if particion not in self._particiones:
+                crear_particion(conex, particion)
+                self._particiones.add(particion)
+            cursor = conex.executemany(f'INSERT OR IGNORE INTO {particion} VALUES (?, ?, ?, ?, ?, ?)', filas_particion)
+            if cursor.rowcount == len(filas_particion):
+                nuevas.extend(filas_particion)
+            else:
+                # los duplicados ignorados dejan huecos en los id; se ve cuáles quedaron
+                ids = {id for id, in conex.execute(
+                    f'SELECT id FROM {particion} WHERE id BETWEEN ? AND ?',
+                    (filas_particion[0][0], filas_particion[-1][0]))}
+                nuevas.extend(fila for fila in filas_particion if fila[0] in ids)
+        if len(por_particion) > 1:
+            nuevas.sort()
+        if siguiente != self.ultimo_id:
+            conex.execute("INSERT OR REPLACE INTO secuencias VALUES ('mediciones', ?)", (siguiente,))
+        return nuevas, siguiente, vencidas
+
+    def run(self):
+        conex = sqlite3.connect(self.ruta, check_same_thread=False)
+        conex.execute('PRAGMA journal_mode=WAL')
+        conex.execute('PRAGMA synchronous=NORMAL')
+        fila = conex.execute("SELECT valor FROM secuencias WHERE nombre = 'mediciones'").fetchone()
+        self.ultimo_id = fila[0] if fila else 0
+        self._particiones = set(particiones(conex))
+        while True:
+            # el timeout hace que la retención se aplique aunque no lleguen mediciones
+            grupo = self.tomar_grupo(max(0.0, self._proxima_retencion - time.monotonic()))
+            if time.monotonic() >= self._proxima_retencion:
+                try:
+                    self.aplicar_retencion(conex)
+                except Exception as e:
+                    log.error("Error aplicando retención: %s", e)
+                    self._particiones = set(particiones(conex))
+            if not grupo:
+                continue
+            filas = [fila for item in grupo for fila in item[0]]
+            inicio = time.perf_counter()
+            try:
+                with conex:
+                    nuevas, secuencia, vencidas = self.insertar(conex, filas)
+                    # los agregados se actualizan en la misma transacción que las filas crudas
+                    actualizar_agregados(conex, nuevas)
+                # si la transacción se deshace los id no se consumen
+                self.ultimo_id = secuencia
+                insertadas = len(nuevas)
+                ok = True
+            except Exception as e:
+                log.error("Error con base de datos: %s", e)
+                self._particiones = set(particiones(conex))
+                insertadas = 0
+                ok = False
+
+            for _, confirmacion in grupo:
+                confirmacion.completar(ok)
+            if not ok:
+                continue
+
+            duplicadas = len(filas) - insertadas - vencidas
+            self.lotes += 1
+            self.total_insertadas += insertadas
+            self.total_vencidas += vencidas
+            self.total_duplicadas += duplicadas
+            self.ultimo_lote = {
+                "filas": len(filas),
+                "insertadas": insertadas,
+                "duplicadas": duplicadas,
+                "vencidas": vencidas,
+                "duracion_ms": (time.perf_counter() - inicio) * 1000
+            }
+            LOTE_FILAS.observar(len(filas))
+            COMMIT_SEGUNDOS.observar(self.ultimo_lote["duracion_ms"] / 1000)
+            log.debug("Lote escrito: %d insertadas, %d duplicadas ignoradas", insertadas, duplicadas)
+            if nuevas:
+                self.notificar(nuevas)
+                # después de notificar: un validador nuevo nunca acompaña a los últimos valores viejos
+                self.marcar_cambio()
+
+    def notificar(self, nuevas):
+        for funcion in self._suscriptores:
+            try:
+                funcion(nuevas)
+            except Exception as e:
+                log.exception("Error notificando mediciones insertadas: %s", e)
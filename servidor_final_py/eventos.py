@@ -0,0 +1,57 @@
+import threading
+from collections import deque
+
+
+# Buffer de un suscriptor: acotado, si el consumidor se atrasa se descartan los eventos más antiguos
+class Suscripcion:
+    def __init__(self, capacidad):
+        self._eventos = deque(maxlen=capacidad)
+        self._cond = threading.Condition()
+        self.descartados = 0
+
+    def entregar(self, eventos):
+        with self._cond:
+            for evento in eventos:
+                if len(self._eventos) == self._eventos.maxlen:
+                    self.descartados += 1
+                self._eventos.append(evento)
+            self._cond.notify()
+
+    # Espera hasta timeout segundos y devuelve todos los eventos pendientes (o lista vacía)
+    def recibir(self, timeout=None):
+        with self._cond:
+            if not self._eventos:
+                self._cond.wait(timeout)
+            eventos = list(self._eventos)
+            self._eventos.clear()
+            return eventos
+
+
+# Bus pub/sub en proceso para las mediciones recién insertadas
+class BusEventos:
+    def __init__(self, capacidad_suscriptor=1000):
+        self.capacidad_suscriptor = capacidad_suscriptor
+        self._suscripciones = set()
+        self._lock = threading.Lock()
+        self.publicados = 0
+
+    def suscribir(self, capacidad=None):
+        suscripcion = Suscripcion(capacidad or self.capacidad_suscriptor)
+        with self._lock:
+            self._suscripciones.add(suscripcion)
+        return suscripcion
+
+    def desuscribir(self, suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def publicar(self, eventos):
+        with self._lock:
+            suscripciones = list(self._suscripciones)
+            self.publicados += len(eventos)
+        for suscripcion in suscripciones:
+            suscripcion.entregar(eventos)
+
+    def suscriptores(self):
+        with self._lock:
+            return len(self._suscripciones)
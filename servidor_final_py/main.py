@@ -1,12 +1,27 @@
 import threading
 import socket
 import json
-from flask import Flask, jsonify
-from db import inicializar_db, insertar_medicion, obtener_mediciones
 import base64
-from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.asymmetric import padding
+import functools
+import gzip
+import logging
+import os
+import sys
+import time
+import zlib
+from datetime import datetime, timezone
+from flask import Flask, Response, g, jsonify, request
+from werkzeug.http import is_resource_modified
+# Módulos compartidos entre los servicios (paquete comun/ en la raíz del repositorio)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import inicializar_db, iterar_mediciones, iterar_mediciones_nuevas, obtener_mediciones, obtener_ultimas_mediciones, iterar_agregados, EscritorMediciones, RESOLUCIONES, METRICAS, texto_a_epoch, epoch_a_texto
 from opcua_servidor import iniciar_opcua
+from verificacion import VerificadorFirmas
+from eventos import BusEventos
+from ultimos import UltimosValores
+from comun.protocolo import FORMATO_BINARIO, FORMATO_JSON
+from comun.lector import LectorSocket
+from comun.metricas import REGISTRO, TIPO_CONTENIDO, Contador, Histograma, Medidor
 
 
 # Obtener IP
@@ -26,92 +41,411 @@ IP = obtener_ip_servidor()
 PUERTO_RECEPCION = 5000
 PUERTO_API = 8000
 PUERTO_OPCUA = 4840
+TRABAJADORES_VERIFICACION = None  # None = un trabajador por núcleo
+VERIFICACION_PROCESOS = False  # True usa un pool de procesos en vez de hilos
+TIMEOUT_ESCRITURA = 10  # segundos máximos esperando que un lote quede guardado
+LIMITE_MAXIMO_API = 10000  # filas máximas por página en /api/mediciones
+BUFFER_SUSCRIPTOR = 1000  # eventos pendientes por suscriptor del stream antes de descartar los más antiguos
+KEEPALIVE_STREAM = 15  # segundos entre comentarios keep-alive del stream SSE
+ACEPTAR_BINARIO = True  # aceptar el formato binario bin1 cuando el intermedio lo ofrece
+COMPRIMIR_MIN_BYTES = 500  # respuestas más chicas no se comprimen aunque el cliente acepte gzip
+NIVEL_LOG = logging.INFO  # logging.DEBUG muestra cada lote y medición recibidos
+
+# config.json opcional en el directorio de trabajo: reemplaza las constantes de arriba que tengan
+# el mismo nombre, ej. {"IP": "127.0.0.1", "PUERTO_API": 8080, "NIVEL_LOG": 10}
+CONSTANTES_DESCONOCIDAS = []
+try:
+    with open("config.json", "r") as f:
+        for nombre, valor in json.load(f).items():
+            if nombre.isupper() and nombre in globals():
+                globals()[nombre] = valor
+            else:
+                CONSTANTES_DESCONOCIDAS.append(nombre)
+except FileNotFoundError:
+    pass
+
+logging.basicConfig(level=NIVEL_LOG, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logging.getLogger("opcua").setLevel(max(NIVEL_LOG, logging.WARNING))  # la librería es muy verbosa en DEBUG
+logging.getLogger("werkzeug").setLevel(max(NIVEL_LOG, logging.INFO))  # una línea por petición HTTP en INFO
+log = logging.getLogger("servidor_final")
+if CONSTANTES_DESCONOCIDAS:
+    log.warning("config.json: se ignoran %s", ", ".join(CONSTANTES_DESCONOCIDAS))
 
 # Cargar clave pública del servidor intermedio
 with open("pub_intermedio.pem", "rb") as f:
-    CLAVE_PUB_INTERMEDIO = serialization.load_pem_public_key(f.read())
+    PEM_PUB_INTERMEDIO = f.read()
 
-# Verificar firma paquete serv intermedio
-def verificar_firma(mensaje, firma_cod):
-    try:
-        firma = base64.b64decode(firma_cod.encode('utf-8'))
-        serializado = json.dumps(mensaje, separators=(',', ':')).encode('utf-8')
-        CLAVE_PUB_INTERMEDIO.verify(
-            signature=firma,
-            data=serializado,
-            padding=padding.PKCS1v15(),
-            algorithm=hashes.SHA256()
-        )
-        return True
-    except Exception as e:
-        print(f"firma inválida, error: {e}")
-        return False
+# Pool de verificación de firmas, se crea al iniciar el servidor TCP
+verificador = None
 
 # Inicializar base de datos
 inicializar_db()
+escritor = EscritorMediciones()
+
+# Las mediciones recién guardadas actualizan el caché de últimos valores y se publican
+# en el bus sin volver a consultar la base
+bus = BusEventos(BUFFER_SUSCRIPTOR)
+ultimos = UltimosValores()
+
+def publicar_insertadas(filas):
+    mediciones = [fila_a_dict(f) for f in filas]
+    ultimos.actualizar(mediciones)
+    bus.publicar(mediciones)
+
+escritor.suscribir(publicar_insertadas)
+
+# Métricas de cada etapa, expuestas en /metrics
+CONEXIONES = Contador("final_conexiones_aceptadas_total", "Conexiones TCP aceptadas desde servidores intermedios")
+CONEXIONES_ACTIVAS = Medidor("final_conexiones_activas", "Conexiones TCP abiertas desde servidores intermedios")
+MENSAJES = Contador("final_mensajes_recibidos_total", "Líneas JSON o tramas binarias recibidas", ("formato",))
+FIRMAS = Contador("final_firmas_total", "Mensajes verificados según el resultado de la firma", ("resultado",))
+RESPUESTAS_LOTE = Contador("final_lotes_respondidos_total", "Lotes respondidos al intermedio", ("respuesta",))
+API_SEGUNDOS = Histograma("final_api_segundos", "Tiempo de cada petición HTTP hasta que sale la respuesta "
+                          "(en las respuestas en streaming no incluye el envío del cuerpo)", ("ruta",))
+Medidor("final_db_cola", "Grupos de mediciones esperando al escritor", funcion=lambda: escritor.cola.qsize())
+Contador("final_db_lotes_total", "Commits del escritor", funcion=lambda: escritor.lotes)
+Contador("final_db_filas_total", "Filas recibidas por el escritor según lo que pasó con ellas", ("resultado",),
+         funcion=lambda: {("insertada",): escritor.total_insertadas, ("duplicada",): escritor.total_duplicadas,
+                          ("vencida",): escritor.total_vencidas})
+Medidor("final_stream_suscriptores", "Clientes conectados al stream SSE", funcion=lambda: bus.suscriptores())
 
 # Servidor TCP que recibe datos del intermediario
 def servidor():
-    print(f"Servidor final escuchando en {IP}:{PUERTO_RECEPCION} (TCP)")
-    print(f"API funcionando en {IP}:{PUERTO_API}")
-    print(f"Servidor OPC UA activo en {IP}:4840")
+    global verificador
+    verificador = VerificadorFirmas(PEM_PUB_INTERMEDIO, TRABAJADORES_VERIFICACION, VERIFICACION_PROCESOS)
+    log.info("Servidor final escuchando en %s:%d (TCP)", IP, PUERTO_RECEPCION)
+    log.info("API funcionando en %s:%d", IP, PUERTO_API)
+    log.info("Servidor OPC UA activo en %s:4840", IP)
 
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # permite reiniciar sin esperar TIME_WAIT
         s.bind((IP, PUERTO_RECEPCION))
         s.listen()
 
         while True:
             conex,ip = s.accept()
+            CONEXIONES.inc()
             threading.Thread(target=recepcion_datos, args=(conex, ip), daemon=True).start()
 
+# Saca del lector las líneas completas; se detiene en un saludo HOLA porque lo que
+# viene después puede estar en otro formato. Devuelve (lineas, saludo o None)
+def separar_lineas(lector):
+    lineas = []
+    while True:
+        linea = lector.linea()
+        if linea is None:
+            return lineas, None
+        if linea.startswith(b'HOLA '):
+            return lineas, linea
+        lineas.append(linea)
+
+# Saca del lector las tramas binarias completas (largo u32 + cuerpo)
+def separar_tramas(lector):
+    tramas = []
+    while True:
+        cuerpo = lector.trama()
+        if cuerpo is None:
+            return tramas
+        tramas.append(cuerpo)
+
+# Responde al saludo del intermedio con el formato elegido; True si se pasa a binario
+def negociar_formato(conex, saludo):
+    ofrecidos = saludo[len(b'HOLA '):].decode('utf-8').split(',')
+    formato = FORMATO_BINARIO if ACEPTAR_BINARIO and FORMATO_BINARIO in ofrecidos else FORMATO_JSON
+    conex.sendall(f"FORMATO {formato}\n".encode('utf-8'))
+    return formato == FORMATO_BINARIO
+
+def procesar_verificados(conex, resultados):
+    for es_lote, mediciones in resultados:
+        FIRMAS.inc(etiquetas=("valida" if mediciones is not None else "invalida",))
+        if es_lote:
+            # Lote de mediciones firmado una sola vez, se responde OK o RECHAZADO
+            if mediciones is not None:
+                # solo se confirma cuando el lote quedó guardado en disco
+                if escritor.encolar(mediciones).esperar(TIMEOUT_ESCRITURA):
+                    log.debug("Lote de %d mediciones almacenado", len(mediciones))
+                    respuesta = b'OK\n'
+                else:
+                    log.error("Lote no pudo ser almacenado")
+                    respuesta = b'ERROR\n'
+            else:
+                log.warning("Lote rechazado por firma de servidor inválida")
+                respuesta = b'RECHAZADO\n'
+            conex.sendall(respuesta)
+            RESPUESTAS_LOTE.inc(etiquetas=(respuesta.decode('ascii').strip(),))
+            continue
+        if mediciones is not None:
+            escritor.encolar(mediciones)
+            log.debug("Medición almacenada desde sensor %s", mediciones[0]['id'])
+        else:
+            log.warning("Medición rechazada por firma de servidor inválida")
+
 def recepcion_datos(conex, ip):
+    CONEXIONES_ACTIVAS.inc()
     with conex:
-        buffer = b""
+        lector = LectorSocket(conex)
+        binario = False
         try:
-            while True:
-                data = conex.recv(1024)
-                if not data:
-                    break
-                buffer += data
-                while b'\n' in buffer:
-                    line, buffer = buffer.split(b'\n', 1)
-                    sensor_data = json.loads(line.decode('utf-8'))
-                    datos = sensor_data.get("datos")
-                    firma = sensor_data.get("firma")
-                    if verificar_firma(datos, firma):
-                        codificado = base64.b64encode(json.dumps(datos).encode('utf-8')).decode('utf-8')
-                        insertar_medicion(codificado)
-                        print(f"Medición almacenada desde sensor {datos['id']}")
-                    else:
-                        print("Medición rechazada por firma de servidor inválida")
-                    print(f"Servidor final escuchando en {IP}:{PUERTO_RECEPCION} (TCP)")
-                    print(f"API funcionando en {IP}:{PUERTO_API}")
-                    print(f"Servidor OPC UA activo en {IP}:4840")
+            while lector.recibir():
+                while True:
+                    # todas las líneas o tramas completas se verifican en paralelo en el pool
+                    if binario:
+                        tramas = separar_tramas(lector)
+                        MENSAJES.inc(len(tramas), (FORMATO_BINARIO,))
+                        procesar_verificados(conex, verificador.verificar_tramas(tramas))
+                        break
+                    lineas, saludo = separar_lineas(lector)
+                    MENSAJES.inc(len(lineas), (FORMATO_JSON,))
+                    procesar_verificados(conex, verificador.verificar(lineas))
+                    if saludo is None:
+                        break
+                    binario = negociar_formato(conex, saludo)
         except Exception as e:
-            print(f"Error procesando datos: {e}")
+            log.warning("Error procesando datos de %s: %s", ip, e)
+        finally:
+            CONEXIONES_ACTIVAS.dec()
 
 
 # API REST para consulta
 app = Flask(__name__)
 
+def fila_a_dict(r):
+    return {
+        'id': r[0],
+        'sensor_id': r[1],
+        'timestamp': epoch_a_texto(r[2]),
+        'temperatura': r[3],
+        'presion': r[4],
+        'humedad': r[5]
+    }
+
+# El cursor de paginación es opaco para el cliente: "timestamp|id" en base64 (timestamp epoch)
+def codificar_cursor(timestamp, id):
+    return base64.urlsafe_b64encode(f"{timestamp}|{id}".encode('utf-8')).decode('ascii')
+
+def decodificar_cursor(cursor):
+    timestamp, id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+    return int(timestamp), int(id)
+
+# Fila de una tabla de agregados: (sensor_id, intervalo, y por cada métrica min, max, suma, cantidad)
+def agregado_a_dict(r):
+    resultado = {'sensor_id': r[0], 'intervalo': epoch_a_texto(r[1])}
+    for i, metrica in enumerate(METRICAS):
+        minimo, maximo, suma, cantidad = r[2 + i * 4:6 + i * 4]
+        resultado[metrica] = {
+            'min': minimo,
+            'max': maximo,
+            'avg': suma / cantidad if cantidad else None,
+            'count': cantidad
+        }
+    return resultado
+
+# Genera el arreglo JSON fila por fila en vez de construir la lista completa
+def json_en_streaming(filas, convertir=fila_a_dict):
+    yield '['
+    primera = True
+    for fila in filas:
+        if not primera:
+            yield ','
+        primera = False
+        yield json.dumps(convertir(fila))
+    yield ']'
+
+def parametro_entero(nombre):
+    valor = request.args.get(nombre)
+    return int(valor) if valor is not None else None
+
+# Fecha "AAAA-MM-DD HH:MM:SS" de la query string como epoch, igual que se guarda en la base
+def parametro_fecha(nombre):
+    valor = request.args.get(nombre)
+    return texto_a_epoch(valor) if valor is not None else None
+
+# Validadores de los datos guardados: el ETag cambia con cada commit que inserta filas o
+# elimina particiones y Last-Modified es la hora de ese commit. Una consulta repetida con
+# If-None-Match (o solo If-Modified-Since) responde 304 sin ejecutar la consulta.
+# If-Modified-Since tiene resolución de segundos, por eso If-None-Match tiene prioridad
+def condicional(vista):
+    @functools.wraps(vista)
+    def envoltura(*args, **kwargs):
+        etag = f"{escritor.arranque}-{escritor.version}"
+        modificado = datetime.fromtimestamp(escritor.ultima_escritura, timezone.utc)
+        if not is_resource_modified(request.environ, etag=etag, last_modified=modificado):
+            respuesta = Response(status=304)
+        else:
+            respuesta = app.make_response(vista(*args, **kwargs))
+            if respuesta.status_code != 200:
+                return respuesta
+        respuesta.set_etag(etag, weak=True)
+        respuesta.last_modified = modificado
+        respuesta.headers['Cache-Control'] = 'no-cache'
+        return respuesta
+    return envoltura
+
+@app.before_request
+def iniciar_cronometro():
+    g.inicio = time.perf_counter()
+
+@app.after_request
+def registrar_duracion(respuesta):
+    ruta = request.url_rule.rule if request.url_rule is not None else "otra"
+    API_SEGUNDOS.observar(time.perf_counter() - g.inicio, (ruta,))
+    return respuesta
+
+# Comprime con gzip las respuestas para clientes que lo aceptan (menos el stream SSE, que
+# debe llegar evento por evento). Las respuestas en streaming se comprimen a medida que salen
+@app.after_request
+def comprimir(respuesta):
+    if (respuesta.status_code != 200 or respuesta.mimetype == 'text/event-stream'
+            or 'Content-Encoding' in respuesta.headers
+            or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+        return respuesta
+    respuesta.vary.add('Accept-Encoding')
+    if respuesta.is_streamed:
+        respuesta.response = gzip_en_streaming(respuesta.response)
+        respuesta.headers.pop('Content-Length', None)
+    else:
+        datos = respuesta.get_data()
+        if len(datos) < COMPRIMIR_MIN_BYTES:
+            return respuesta
+        respuesta.set_data(gzip.compress(datos, 6))
+    respuesta.headers['Content-Encoding'] = 'gzip'
+    return respuesta
+
+def gzip_en_streaming(partes):
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = formato gzip
+    try:
+        for parte in partes:
+            if isinstance(parte, str):
+                parte = parte.encode('utf-8')
+            comprimido = compresor.compress(parte)
+            if comprimido:
+                yield comprimido
+        yield compresor.flush()
+    finally:
+        if hasattr(partes, 'close'):
+            partes.close()
+
+# Parámetros opcionales: sensor_id, since, until ("AAAA-MM-DD HH:MM:SS"), limit y cursor
+# Si la página viene llena, el cursor de la siguiente va en el header X-Cursor-Siguiente
+# Con after_id funciona como feed de cambios: filas con id mayor, en orden ascendente de id
 @app.route('/api/mediciones', methods=['GET'])
+@condicional
 def api_mediciones():
-    rows = obtener_mediciones()
-    resultados = [
-        {
-            'id': r[0],
-            'sensor_id': r[1],
-            'timestamp': r[2],
-            'temperatura': r[3],
-            'presion': r[4],
-            'humedad': r[5]
-        }
-        for r in rows
-    ]
-    return jsonify(resultados)
+    try:
+        despues_de_id = parametro_entero('after_id')
+        sensor_id = parametro_entero('sensor_id')
+        desde = parametro_fecha('since')
+        hasta = parametro_fecha('until')
+        limite = parametro_entero('limit')
+        cursor = request.args.get('cursor')
+        if cursor is not None:
+            cursor = decodificar_cursor(cursor)
+        if limite is not None and not (0 < limite <= LIMITE_MAXIMO_API):
+            raise ValueError(f"limit debe estar entre 1 y {LIMITE_MAXIMO_API}")
+    except Exception as e:
+        return jsonify({'error': f"parametros invalidos: {e}"}), 400
+
+    if despues_de_id is not None:
+        filas = iterar_mediciones_nuevas(despues_de_id, limite or LIMITE_MAXIMO_API, sensor_id)
+        return Response(json_en_streaming(filas), mimetype='application/json')
+
+    if limite is None:
+        return Response(json_en_streaming(iterar_mediciones(sensor_id, desde, hasta)), mimetype='application/json')
+
+    # la página se lee de una vez: el cursor sale de la última fila que se envía, así una
+    # escritura entre medio no puede hacer que el cliente se salte filas
+    filas = obtener_mediciones(sensor_id, desde, hasta, limite, cursor)
+    respuesta = Response(json_en_streaming(filas), mimetype='application/json')
+    if len(filas) == limite:
+        ultima = filas[-1]
+        respuesta.headers['X-Cursor-Siguiente'] = codificar_cursor(ultima[2], ultima[0])
+    return respuesta
+
+# Mediciones agregadas por intervalo (bucket = 1m, 1h o 1d) con min/max/avg/count por métrica
+# Parámetros opcionales: sensor_id, since, until (sobre el inicio del intervalo) y limit
+@app.route('/api/mediciones/agregado', methods=['GET'])
+@condicional
+def api_agregado():
+    try:
+        resolucion = request.args.get('bucket', '1h')
+        if resolucion not in RESOLUCIONES:
+            raise ValueError(f"bucket debe ser uno de {', '.join(RESOLUCIONES)}")
+        sensor_id = parametro_entero('sensor_id')
+        desde = parametro_fecha('since')
+        hasta = parametro_fecha('until')
+        limite = parametro_entero('limit') or LIMITE_MAXIMO_API
+        if not (0 < limite <= LIMITE_MAXIMO_API):
+            raise ValueError(f"limit debe estar entre 1 y {LIMITE_MAXIMO_API}")
+    except Exception as e:
+        return jsonify({'error': f"parametros invalidos: {e}"}), 400
+
+    filas = iterar_agregados(resolucion, sensor_id, desde, hasta, limite)
+    return Response(json_en_streaming(filas, agregado_a_dict), mimetype='application/json')
+
+# Último valor de cada sensor, servido desde memoria
+@app.route('/api/ultimas', methods=['GET'])
+@condicional
+def api_ultimas():
+    return jsonify(ultimos.todos())
+
+# Métricas de todas las etapas en formato Prometheus
+@app.route('/metrics', methods=['GET'])
+def metricas():
+    return Response(REGISTRO.exponer(), content_type=TIPO_CONTENIDO)
+
+def evento_sse(medicion):
+    return f"id: {medicion['id']}\ndata: {json.dumps(medicion)}\n\n"
+
+# Stream en vivo de mediciones nuevas (Server-Sent Events), filtro opcional por sensor_id
+# Si el navegador reconecta con Last-Event-ID se reenvían desde la base las que se perdió
+@app.route('/api/mediciones/stream', methods=['GET'])
+def api_stream():
+    try:
+        sensor_id = parametro_entero('sensor_id')
+        ultimo_evento = request.headers.get('Last-Event-ID')
+        ultimo_evento = int(ultimo_evento) if ultimo_evento else None
+    except Exception as e:
+        return jsonify({'error': f"parametros invalidos: {e}"}), 400
+
+    suscripcion = bus.suscribir()
+
+    def generar():
+        try:
+            ultimo_enviado = 0
+            if ultimo_evento is not None:
+                ultimo_enviado = ultimo_evento
+                # de a páginas hasta ponerse al día, aunque se haya perdido más de una página
+                while True:
+                    enviadas = 0
+                    for fila in iterar_mediciones_nuevas(ultimo_enviado, LIMITE_MAXIMO_API, sensor_id):
+                        ultimo_enviado = fila[0]
+                        enviadas += 1
+                        yield evento_sse(fila_a_dict(fila))
+                    if enviadas < LIMITE_MAXIMO_API:
+                        break
+            descartados = 0
+            while True:
+                eventos = suscripcion.recibir(KEEPALIVE_STREAM)
+                if suscripcion.descartados != descartados:
+                    # el cliente se atrasó, se le avisa cuántos eventos perdió
+                    yield f"event: descartados\ndata: {suscripcion.descartados - descartados}\n\n"
+                    descartados = suscripcion.descartados
+                if not eventos:
+                    yield ": keep-alive\n\n"
+                    continue
+                for medicion in eventos:
+                    # lo que ya salió en el reenvío inicial no se repite
+                    if medicion['id'] > ultimo_enviado and (sensor_id is None or medicion['sensor_id'] == sensor_id):
+                        yield evento_sse(medicion)
+        finally:
+            bus.desuscribir(suscripcion)
+
+    return Response(generar(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 # Lanzamiento de servidor socket y API REST
 if __name__ == '__main__':
+    ultimos.actualizar([fila_a_dict(f) for f in obtener_ultimas_mediciones()])
+    escritor.start()
     threading.Thread(target=servidor, daemon=True).start()
-    threading.Thread(target=iniciar_opcua, daemon=True).start()
-    app.run(host=obtener_ip_servidor(), port=PUERTO_API)
+    threading.Thread(target=iniciar_opcua, args=(bus, ultimos), daemon=True).start()
+    app.run(host=IP, port=PUERTO_API)
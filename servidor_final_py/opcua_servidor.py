@@ -1,6 +1,5 @@
 from opcua import Server, ua
-from db import obtener_mediciones
-import time
+from datetime import datetime
 import socket
 # Obtener IP
 # Código obtenido de stackoverflow, pregunta 166506
@@ -16,35 +15,82 @@ def obtener_ip_servidor():
         s.close()
     return IP
 
-def iniciar_opcua():
+VARIABLES = (("temperatura", "Temperatura"), ("presion", "Presion"), ("humedad", "Humedad"))
+
+# El timestamp de la medición se usa como SourceTimestamp (hora local del sensor)
+def fecha_medicion(timestamp):
+    try:
+        return datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+
+# Un objeto OPC UA por sensor, creado la primera vez que aparece
+# Las variables solo se escriben cuando el valor cambia, así las suscripciones
+# de los clientes SCADA reciben un data change por cada lectura nueva real
+class EspacioSensores:
+    def __init__(self, server, namespace):
+        self.namespace = namespace
+        self.objeto_sensores = server.nodes.objects.add_object(ua.NodeId("Sensores", namespace), "Sensores")
+        self.nodos = {}  # sensor_id -> {campo: variable}
+        self.valores = {}  # sensor_id -> {campo: último valor publicado}
+
+    def nodos_sensor(self, sensor_id):
+        nodos = self.nodos.get(sensor_id)
+        if nodos is None:
+            objeto = self.objeto_sensores.add_object(
+                ua.NodeId(f"Sensores.{sensor_id}", self.namespace), f"Sensor_{sensor_id}")
+            nodos = {
+                campo: objeto.add_variable(
+                    ua.NodeId(f"Sensores.{sensor_id}.{nombre}", self.namespace), nombre, 0.0, ua.VariantType.Double)
+                for campo, nombre in VARIABLES
+            }
+            nodos["timestamp"] = objeto.add_variable(
+                ua.NodeId(f"Sensores.{sensor_id}.Timestamp", self.namespace), "Timestamp", "", ua.VariantType.String)
+            self.nodos[sensor_id] = nodos
+            self.valores[sensor_id] = {}
+        return nodos
+
+    def publicar(self, medicion):
+        nodos = self.nodos_sensor(medicion["sensor_id"])
+        valores = self.valores[medicion["sensor_id"]]
+        # una medición atrasada no reemplaza el último valor del sensor
+        if "timestamp" in valores and medicion["timestamp"] < valores["timestamp"]:
+            return
+        fuente = fecha_medicion(medicion["timestamp"])
+        for campo, _ in VARIABLES:
+            valor = medicion.get(campo)
+            if valor is None or valores.get(campo) == valor:
+                continue
+            dato = ua.DataValue(ua.Variant(float(valor), ua.VariantType.Double))
+            dato.SourceTimestamp = fuente
+            dato.ServerTimestamp = datetime.utcnow()
+            nodos[campo].set_value(dato)
+            valores[campo] = valor
+        if valores.get("timestamp") != medicion["timestamp"]:
+            nodos["timestamp"].set_value(ua.Variant(str(medicion["timestamp"]), ua.VariantType.String))
+            valores["timestamp"] = medicion["timestamp"]
+
+def iniciar_opcua(bus, ultimos):
     server = Server()
     server.set_endpoint(f"opc.tcp://{obtener_ip_servidor()}:4840/")
     server.set_server_name("Servidor OPC UA")
     server.set_security_policy([ua.SecurityPolicyType.NoSecurity])
 
     namespace = server.register_namespace("http://proyectosemestral.com")
-    objeto_sensores = server.nodes.objects.add_object(namespace, "Sensores")
+    espacio = EspacioSensores(server, namespace)
 
-    # Variables dinámicas (estas se actualizarán periódicamente)
-    temp_var = objeto_sensores.add_variable(namespace, "Temperatura", 0.0)
-    pres_var = objeto_sensores.add_variable(namespace, "Presion", 0.0)
-    hum_var = objeto_sensores.add_variable(namespace, "Humedad", 0.0)
+    # suscribirse antes de leer el caché para no perder mediciones entre medio
+    suscripcion = bus.suscribir()
+    for medicion in ultimos.todos():
+        espacio.publicar(medicion)
 
     server.start()
 
     try:
         while True:
-            rows = obtener_mediciones()
-            if rows:
-                last = rows[-1]
-                decoded = {
-                    "temperatura": last[3],
-                    "presion": last[4],
-                    "humedad": last[5]
-                }
-                temp_var.set_value(decoded["temperatura"])
-                pres_var.set_value(decoded["presion"])
-                hum_var.set_value(decoded["humedad"])
-            time.sleep(3)
+            # se despierta con cada lote insertado, sin consultar la base de datos
+            for medicion in suscripcion.recibir(timeout=60):
+                espacio.publicar(medicion)
     finally:
+        bus.desuscribir(suscripcion)
         server.stop()
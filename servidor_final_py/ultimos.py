@@ -0,0 +1,29 @@
+import threading
+
+
+# Último valor conocido de cada sensor, actualizado en cada inserción
+# Leer el estado actual cuesta O(sensores) y no toca la base de datos
+class UltimosValores:
+    def __init__(self):
+        self._por_sensor = {}
+        self._lock = threading.Lock()
+
+    # Solo reemplaza si la medición es más reciente, una medición atrasada no pisa a una nueva
+    def actualizar(self, mediciones):
+        cambiados = []
+        with self._lock:
+            for medicion in mediciones:
+                actual = self._por_sensor.get(medicion['sensor_id'])
+                if actual is None or (medicion['timestamp'], medicion['id']) > (actual['timestamp'], actual['id']):
+                    self._por_sensor[medicion['sensor_id']] = medicion
+                    cambiados.append(medicion)
+        return cambiados
+
+    def obtener(self, sensor_id):
+        with self._lock:
+            return self._por_sensor.get(sensor_id)
+
+    def todos(self):
+        with self._lock:
+            return sorted(self._por_sensor.values(), key=lambda m: m['sensor_id'])
+
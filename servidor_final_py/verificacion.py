@@ -0,0 +1,104 @@
+import base64
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from comun.protocolo import leer_cuerpo
+from comun.metricas import Histograma
+
+log = logging.getLogger(__name__)
+
+# Clave pública del servidor intermedio, una por proceso trabajador
+_CLAVE = None
+
+VERIFICACION = Histograma("final_verificacion_segundos",
+                          "Tiempo de decodificar y verificar la firma de cada mensaje del intermedio")
+
+
+def _cargar_clave(pem):
+    global _CLAVE
+    _CLAVE = serialization.load_pem_public_key(pem)
+
+
+def verificar_bytes(datos, firma):
+    try:
+        _CLAVE.verify(
+            signature=firma,
+            data=datos,
+            padding=padding.PKCS1v15(),
+            algorithm=hashes.SHA256()
+        )
+        return True
+    except Exception as e:
+        log.debug("firma inválida, error: %r", e)
+        return False
+
+# Verificar firma de un mensaje (lote o medición) del servidor intermedio
+def verificar_firma(mensaje, firma_cod):
+    try:
+        firma = base64.b64decode(firma_cod.encode('utf-8'))
+        serializado = json.dumps(mensaje, separators=(',', ':')).encode('utf-8')
+    except Exception as e:
+        log.debug("firma inválida, error: %r", e)
+        return False
+    return verificar_bytes(serializado, firma)
+
+
+# Decodifica y verifica una línea recibida del servidor intermedio
+# Devuelve (es_lote, mediciones) con mediciones = None si la firma no es válida
+def verificar_linea(linea):
+    sensor_data = json.loads(linea.decode('utf-8'))
+    firma = sensor_data.get("firma")
+    if "lote" in sensor_data:
+        lote = sensor_data.get("lote")
+        return True, (lote if verificar_firma(lote, firma) else None)
+    datos = sensor_data.get("datos")
+    return False, ([datos] if verificar_firma(datos, firma) else None)
+
+
+# Decodifica y verifica el cuerpo de una trama binaria (siempre es un lote)
+def verificar_trama(cuerpo):
+    firmado, firma, mediciones = leer_cuerpo(cuerpo)
+    return True, (mediciones if verificar_bytes(firmado, firma) else None)
+
+
+# Corre en el trabajador: el tiempo medido no incluye la espera en la cola del pool
+def _cronometrado(funcion, argumento):
+    inicio = time.perf_counter()
+    resultado = funcion(argumento)
+    return resultado, time.perf_counter() - inicio
+
+
+# Etapa de verificación compartida por todas las conexiones
+# Con hilos basta porque OpenSSL suelta el GIL durante la verificación RSA;
+# con procesos también se reparte el trabajo de json entre núcleos
+class VerificadorFirmas:
+    def __init__(self, pem, trabajadores=None, usar_procesos=False):
+        self.trabajadores = trabajadores or os.cpu_count() or 1
+        if usar_procesos:
+            self.ejecutor = ProcessPoolExecutor(
+                max_workers=self.trabajadores, initializer=_cargar_clave, initargs=(pem,))
+        else:
+            _cargar_clave(pem)
+            self.ejecutor = ThreadPoolExecutor(max_workers=self.trabajadores, thread_name_prefix="verificacion")
+
+    # Envía varias líneas a verificar en paralelo y devuelve los resultados en el mismo orden
+    def verificar(self, lineas):
+        return self._resultados([self.ejecutor.submit(_cronometrado, verificar_linea, linea) for linea in lineas])
+
+    def verificar_tramas(self, tramas):
+        return self._resultados([self.ejecutor.submit(_cronometrado, verificar_trama, cuerpo) for cuerpo in tramas])
+
+    def _resultados(self, futuros):
+        resultados = []
+        for futuro in futuros:
+            resultado, duracion = futuro.result()
+            VERIFICACION.observar(duracion)
+            resultados.append(resultado)
+        return resultados
+
+    def cerrar(self):
+        self.ejecutor.shutdown(wait=False)
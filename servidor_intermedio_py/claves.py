@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from cryptography.hazmat.primitives import serialization
+
+
+# Registro de claves públicas de sensores
+# Mantiene las claves ya parseadas en memoria (LRU acotado) y revisa el mtime
+# del archivo {sensorId}.pem cada cierto intervalo para detectar claves nuevas o rotadas
+class RegistroClaves:
+    def __init__(self, directorio=".", capacidad=10000, intervalo_revision=5.0):
+        self.directorio = directorio
+        self.capacidad = capacidad
+        self.intervalo_revision = intervalo_revision
+        self._claves = OrderedDict()  # sensorId -> (clave, mtime, ultima_revision)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.recargas = 0
+        self.expulsiones = 0
+
+    def ruta(self, sensor_id):
+        return os.path.join(self.directorio, f"{sensor_id}.pem")
+
+    # Devuelve la clave pública del sensor, cargándola desde disco solo si hace falta
+    # Lanza FileNotFoundError si no existe el .pem del sensor
+    def obtener(self, sensor_id):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._claves.get(sensor_id)
+            if entrada is not None:
+                clave, mtime, ultima_revision = entrada
+                if ahora - ultima_revision < self.intervalo_revision:
+                    self._claves.move_to_end(sensor_id)
+                    self.aciertos += 1
+                    return clave
+
+        # Revisar si el archivo cambió desde la última carga
+        ruta = self.ruta(sensor_id)
+        try:
+            mtime_actual = os.stat(ruta).st_mtime_ns
+        except FileNotFoundError:
+            self.invalidar(sensor_id)
+            raise
+
+        if entrada is not None and entrada[1] == mtime_actual:
+            with self._lock:
+                if sensor_id in self._claves:
+                    self._claves[sensor_id] = (entrada[0], mtime_actual, ahora)
+                    self._claves.move_to_end(sensor_id)
+                self.aciertos += 1
+            return entrada[0]
+
+        with open(ruta, "rb") as archivo:
+            clave = serialization.load_pem_public_key(archivo.read())
+
+        with self._lock:
+            if entrada is None:
+                self.fallos += 1
+            else:
+                self.recargas += 1
+            self._claves[sensor_id] = (clave, mtime_actual, ahora)
+            self._claves.move_to_end(sensor_id)
+            while len(self._claves) > self.capacidad:
+                self._claves.popitem(last=False)
+                self.expulsiones += 1
+        return clave
+
+    def invalidar(self, sensor_id=None):
+        with self._lock:
+            if sensor_id is None:
+                self._claves.clear()
+            else:
+                self._claves.pop(sensor_id, None)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "claves": len(self._claves),
+                "capacidad": self.capacidad,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "recargas": self.recargas,
+                "expulsiones": self.expulsiones
+            }
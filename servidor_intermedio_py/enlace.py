@@ -0,0 +1,97 @@
+import logging
+import socket
+from comun.protocolo import SALUDO, FORMATO_BINARIO, FORMATO_JSON
+
+log = logging.getLogger(__name__)
+
+
+# El servidor final descartó el lote (firma inválida), no tiene sentido reintentarlo
+class LoteRechazado(Exception):
+    pass
+
+
+# El servidor final cerró la conexión de forma ordenada (sin un reset)
+class ConexionCerrada(ConnectionError):
+    pass
+
+
+# Conexión TCP persistente hacia el servidor final
+# Se conecta de forma perezosa y se reabre sola después de un error
+# Con binario=True se negocia el formato bin1 en cada conexión; si el servidor final no lo
+# entiende esa conexión se queda en líneas JSON
+class EnlaceFinal:
+    def __init__(self, host, puerto, timeout=2, binario=True):
+        self.host = host
+        self.puerto = puerto
+        self.timeout = timeout
+        self.binario = binario
+        self.formato = FORMATO_JSON
+        self._sock = None
+        self._pendiente = b''
+
+    def conectar(self):
+        if self._sock is None:
+            self._abrir()
+            if self.binario:
+                try:
+                    if not self.negociar():
+                        # servidor final antiguo: cerró al no entender el saludo. Esta conexión
+                        # sigue con JSON y en la próxima reconexión se vuelve a negociar
+                        log.info("Servidor final no soporta formato binario, usando JSON")
+                        self.cerrar()
+                        self._abrir()
+                except Exception:
+                    self.cerrar()
+                    raise
+        return self._sock
+
+    def _abrir(self):
+        self._sock = socket.create_connection((self.host, self.puerto), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._pendiente = b''
+        self.formato = FORMATO_JSON
+
+    # False si el servidor cerró sin responder al saludo (no entiende HOLA)
+    # Un reset o timeout se propaga: es una conexión fallida, no un rechazo de bin1
+    def negociar(self):
+        self._sock.sendall(SALUDO)
+        try:
+            respuesta = self.leer_linea()
+        except ConexionCerrada:
+            return False
+        if respuesta == b'FORMATO ' + FORMATO_BINARIO.encode():
+            self.formato = FORMATO_BINARIO
+        return True
+
+    def leer_linea(self):
+        while b'\n' not in self._pendiente:
+            token = self._sock.recv(64)
+            if not token:
+                raise ConexionCerrada("servidor final cerró la conexión")
+            self._pendiente += token
+        linea, self._pendiente = self._pendiente.split(b'\n', 1)
+        return linea
+
+    def cerrar(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    # Envía un lote ya armado en el formato negociado y espera la confirmación "OK"
+    # Si algo falla se cierra la conexión y se propaga el error para reintentar el lote
+    def enviar_lote(self, paquete):
+        try:
+            self.conectar().sendall(paquete)
+            respuesta = self.leer_linea()
+            if respuesta == b'RECHAZADO':
+                raise LoteRechazado("lote rechazado por el servidor final")
+            if respuesta != b'OK':
+                raise ConnectionError(f"respuesta inesperada del servidor final: {respuesta!r}")
+        except LoteRechazado:
+            raise
+        except Exception:
+            self.cerrar()
+            raise
@@ -0,0 +1,34 @@
+import bisect
+import hashlib
+
+VIRTUALES = 100  # puntos por fragmento en el anillo, reparten mejor los sensores
+
+
+def _hash(texto):
+    return int.from_bytes(hashlib.md5(texto.encode('utf-8')).digest()[:8], 'big')
+
+# "host:puerto" -> (host, puerto)
+def parsear_destino(destino):
+    host, puerto = destino.rsplit(':', 1)
+    return host, int(puerto)
+
+# Normaliza la lista de fragmentos de la configuración: cada fragmento es un destino
+# "host:puerto" o una lista [primario, réplica, ...]
+def normalizar_fragmentos(fragmentos):
+    return [[fragmento] if isinstance(fragmento, str) else list(fragmento) for fragmento in fragmentos]
+
+
+# Hashing consistente de sensor_id a fragmento
+# Cada fragmento se identifica por su destino primario; al agregar un fragmento solo se mueven
+# a él los sensores que le tocan y el resto sigue yendo al mismo servidor final que antes
+class AnilloHash:
+    def __init__(self, nombres, virtuales=VIRTUALES):
+        puntos = sorted((_hash(f"{nombre}#{i}"), indice)
+                        for indice, nombre in enumerate(nombres) for i in range(virtuales))
+        self._claves = [clave for clave, _ in puntos]
+        self._indices = [indice for _, indice in puntos]
+
+    # Índice del fragmento al que pertenece la clave
+    def fragmento(self, clave):
+        posicion = bisect.bisect(self._claves, _hash(str(clave))) % len(self._claves)
+        return self._indices[posicion]
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from sesion import MARCA, DecodificadorSesion, ErrorSesion, RECHAZADA, aceptada, es_sesion
+
+log = logging.getLogger(__name__)
+
+
+# Modo de escucha alternativo al de un hilo por conexión
+# Un solo event loop atiende todas las conexiones de sensores; la verificación RSA
+# (bloqueante) se delega a un pool de hilos para no frenar el loop
+# Con procesar_sesion también se aceptan sesiones persistentes (ver sesion.py); sus mensajes
+# se procesan de a uno por conexión, en orden
+class IngestaAsync:
+    def __init__(self, procesar, tam_paquete, max_conexiones=1000, timeout=10.0, hilos_verificacion=4, max_pendientes=256,
+                 procesar_sesion=None, timeout_sesion=60.0):
+        self.procesar = procesar  # función bloqueante que recibe el paquete completo
+        self.procesar_sesion = procesar_sesion  # función bloqueante que recibe (sensor_id, mensaje)
+        self.tam_paquete = tam_paquete
+        self.timeout_sesion = timeout_sesion
+        self.max_conexiones = max_conexiones
+        self.timeout = timeout
+        self.max_pendientes = max_pendientes
+        self.ejecutor = ThreadPoolExecutor(max_workers=hilos_verificacion, thread_name_prefix="verificacion")
+        self.activas = 0
+        self.aceptadas = 0
+        self.expiradas = 0
+        self.incompletas = 0
+        self.sesiones = 0
+
+    async def atender_sensor(self, reader, writer, direccion):
+        try:
+            # el timeout cubre toda la lectura, un sensor lento no puede retener la conexión
+            inicio = await asyncio.wait_for(reader.readexactly(MARCA.size), self.timeout)
+            if self.procesar_sesion is not None and es_sesion(inicio):
+                await self.atender_sesion(reader, writer, direccion)
+                return
+            paquete = inicio + await asyncio.wait_for(reader.readexactly(self.tam_paquete - MARCA.size), self.timeout)
+            # no leer más de lo que se alcanza a verificar (backpressure hacia el socket)
+            async with self._pendientes:
+                await asyncio.get_running_loop().run_in_executor(self.ejecutor, self.procesar, paquete)
+        except asyncio.TimeoutError:
+            self.expiradas += 1
+            log.debug("conexion desde %s expirada", direccion)
+        except asyncio.IncompleteReadError:
+            self.incompletas += 1
+            log.debug("paquete incompleto desde %s", direccion)
+        except Exception as e:
+            log.warning("Error en conexion: %s", e)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+            self.activas -= 1
+            self._cupos.release()
+
+    # Mensajes de una sesión hasta que el sensor cierre o pase timeout_sesion sin recibir nada
+    async def atender_sesion(self, reader, writer, direccion):
+        decodificador = DecodificadorSesion()
+        try:
+            decodificador.alimentar(await asyncio.wait_for(reader.readexactly(decodificador.necesita()), self.timeout))
+        except ErrorSesion as e:
+            log.warning("Sesión rechazada desde %s: %s", direccion, e)
+            writer.write(RECHAZADA)
+            await writer.drain()
+            return
+        writer.write(aceptada(decodificador.version))
+        await writer.drain()
+        self.sesiones += 1
+        log.debug("sesión del sensor %s desde %s", decodificador.sensor_id, direccion)
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                datos = await asyncio.wait_for(reader.readexactly(decodificador.necesita()), self.timeout_sesion)
+            except asyncio.IncompleteReadError as e:
+                if e.partial or not decodificador.en_limite():
+                    raise
+                return
+            try:
+                mensaje = decodificador.alimentar(datos)
+            except ErrorSesion as e:
+                log.warning("Sesión del sensor %s cerrada: %s", decodificador.sensor_id, e)
+                return
+            if mensaje is not None:
+                async with self._pendientes:
+                    await loop.run_in_executor(self.ejecutor, self.procesar_sesion, decodificador.sensor_id, mensaje)
+
+    async def escuchar(self, host, puerto):
+        loop = asyncio.get_running_loop()
+        self._cupos = asyncio.Semaphore(self.max_conexiones)
+        self._pendientes = asyncio.Semaphore(self.max_pendientes)
+
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((host, puerto))
+            s.listen(socket.SOMAXCONN)
+            s.setblocking(False)
+            while True:
+                # sin cupo no se acepta: las conexiones nuevas esperan en el backlog del kernel
+                await self._cupos.acquire()
+                conex, direccion = await loop.sock_accept(s)
+                self.activas += 1
+                self.aceptadas += 1
+                try:
+                    reader, writer = await asyncio.open_connection(sock=conex)
+                except Exception as e:
+                    log.warning("Error en conexion: %s", e)
+                    conex.close()
+                    self.activas -= 1
+                    self._cupos.release()
+                    continue
+                asyncio.create_task(self.atender_sensor(reader, writer, direccion))
+
+    def iniciar(self, host, puerto):
+        try:
+            asyncio.run(self.escuchar(host, puerto))
+        finally:
+            self.ejecutor.shutdown(wait=False)
@@ -1,19 +1,87 @@
 import base64
+import logging
+import os
 import socket
 import struct
+import sys
 import threading
 from datetime import datetime
 import json
-import queue
 import time
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding, rsa
 from cryptography.hazmat.primitives import serialization
+# Módulos compartidos entre los servicios (paquete comun/ en la raíz del repositorio)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from claves import RegistroClaves
+from ingesta_async import IngestaAsync
+from enlace import EnlaceFinal, LoteRechazado
+from spool import Spool
+from reintentos import Circuito
+from fragmentos import AnilloHash, normalizar_fragmentos, parsear_destino
+from comun.protocolo import FORMATO_BINARIO, cuerpo_lote, trama, empaquetar_medicion, desempaquetar_medicion
+from comun.lector import LectorSocket
+from repeticiones import NUEVA, VentanaRepeticiones, instante_registro
+from sesion import MARCA, TIPO_LOTE, DecodificadorSesion, ErrorSesion, RECHAZADA, aceptada, es_sesion
+from comun.metricas import BUCKETS_CANTIDAD, Contador, Histograma, Medidor, iniciar_servidor_metricas
 
 # CONFIGURACIÓN
 PUERTO = 4000
 SERVER_FINAL_IP = '192.168.0.40'
 SERVER_FINAL_PUERTO = 5000
+# Varios servidores finales: lista de fragmentos, cada uno "host:puerto" o [primario, réplica, ...]
+# ej. [["192.168.0.40:5000", "192.168.0.41:5000"], ["192.168.0.42:5000"]]. None = solo el de arriba
+SERVIDORES_FINALES = None
+DIRECTORIO_CLAVES = '.'
+MAX_CLAVES_CACHE = 10000
+REVISION_CLAVES_SEG = 5.0  # cada cuanto revisar si el .pem de un sensor cambió
+MODO_SERVIDOR = 'hilos'  # 'hilos' (un hilo por conexión) o 'asyncio'
+MAX_CONEXIONES = 1000  # solo modo asyncio
+TIMEOUT_CONEXION = 10.0  # segundos para recibir el paquete completo, solo modo asyncio
+HILOS_VERIFICACION = 4  # solo modo asyncio
+TIMEOUT_SESION = 60.0  # segundos sin recibir nada antes de cerrar una sesión de sensor
+VENTANA_REPETICIONES_SEG = 300  # por sensor: se descarta lo repetido y lo anterior a esto, None = desactivada
+MAX_REPETICIONES_SENSOR = 4096  # timestamps recordados por sensor dentro de la ventana
+MAX_ADELANTO_SEG = 86400  # se rechaza lo fechado más de esto adelante del reloj del servidor
+SALTO_RELOJ_SEG = 1800  # retroceso del timestamp de un sensor que se toma como cambio de hora
+CONFIRMACIONES_RELOJ = 3  # lecturas seguidas que deben confirmar un cambio de hora
+ENLACES_FINAL = 1  # conexiones persistentes a cada fragmento, cada una con su spool
+TAM_LOTE = 100  # mediciones por lote firmado
+ESPERA_LOTE_MS = 50  # tiempo máximo para completar un lote
+DIRECTORIO_SPOOL = 'spool'  # cola de envíos en disco, sobrevive reinicios
+MAX_BYTES_SPOOL = 256 * 1024 * 1024  # por enlace
+POLITICA_SPOOL = 'rechazar'  # al llenarse: 'rechazar' lo nuevo o 'descartar_antiguos'
+SPOOL_MMAP = False  # leer segmentos cerrados con mmap al vaciar el backlog
+UMBRAL_CIRCUITO = 3  # fallos seguidos antes de dejar de intentar contra el servidor final
+BACKOFF_MIN = 0.05  # segundos, primer reintento
+BACKOFF_MAX = 2.0  # segundos, tope del backoff exponencial
+ENLACE_BINARIO = True  # negociar el formato binario con el servidor final (si no, líneas JSON)
+PUERTO_METRICAS = 9100  # endpoint /metrics en formato Prometheus, None = desactivado
+NIVEL_LOG = logging.INFO  # logging.DEBUG muestra cada conexión, paquete y lote
+
+# 278 es tamaño exacto del paquete de datos + firma
+# 22 el struct
+# 256 firma
+TAM_PAQUETE = 278
+TAM_LECTURA_SESION = 16 * 1024  # bytes por lectura del socket de un sensor
+
+# config.json opcional en el directorio de trabajo: reemplaza las constantes de arriba que tengan
+# el mismo nombre, ej. {"SERVER_FINAL_IP": "127.0.0.1", "MODO_SERVIDOR": "asyncio"}
+CONSTANTES_DESCONOCIDAS = []
+try:
+    with open("config.json", "r") as f:
+        for nombre, valor in json.load(f).items():
+            if nombre.isupper() and nombre in globals():
+                globals()[nombre] = valor
+            else:
+                CONSTANTES_DESCONOCIDAS.append(nombre)
+except FileNotFoundError:
+    pass
+
+logging.basicConfig(level=NIVEL_LOG, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+log = logging.getLogger("servidor_intermedio")
+if CONSTANTES_DESCONOCIDAS:
+    log.warning("config.json: se ignoran %s", ", ".join(CONSTANTES_DESCONOCIDAS))
 
 # Obtener IP
 # Código obtenido de stackoverflow, pregunta 166506
@@ -29,11 +97,18 @@ def obtener_ip_servidor():
         s.close()
     return IP
 
+# Claves públicas de sensores, cargadas una vez y mantenidas en memoria
+REGISTRO_CLAVES = RegistroClaves(DIRECTORIO_CLAVES, MAX_CLAVES_CACHE, REVISION_CLAVES_SEG)
+
+# Mediciones ya aceptadas, para no verificar ni reenviar repeticiones
+REPETICIONES = (VentanaRepeticiones(VENTANA_REPETICIONES_SEG, MAX_REPETICIONES_SENSOR, MAX_CLAVES_CACHE,
+                                    MAX_ADELANTO_SEG, SALTO_RELOJ_SEG, CONFIRMACIONES_RELOJ)
+                if VENTANA_REPETICIONES_SEG is not None else None)
+
 # Verificar firma paquetes
 def verificar_firma(datos,firma,sensorId):
     try:
-        with open(f"{sensorId}.pem", "rb") as archivo:
-            clave_pub = serialization.load_pem_public_key(archivo.read())
+        clave_pub = REGISTRO_CLAVES.obtener(sensorId)
         clave_pub.verify(
             firma,
             datos,
@@ -42,7 +117,7 @@ def verificar_firma(datos,firma,sensorId):
         )
         return True
     except Exception as e:
-        print(f"firma invalida, error: {e}")
+        log.debug("firma invalida, error: %r", e)
         return False
 
 # Decodificar el struct sensordata
@@ -65,84 +140,283 @@ def parsear_datos_sensor(datos):
 with open("clave_intermedio.pem", "rb") as f:
     CLAVE_PRIVADA_INTERMEDIO = serialization.load_pem_private_key(f.read(), password=None)
 
-def firmar_datos(datos):
-    mensaje = json.dumps(datos, separators=(',', ':')).encode('utf-8')
-    firma = CLAVE_PRIVADA_INTERMEDIO.sign(
+def firmar(mensaje):
+    return CLAVE_PRIVADA_INTERMEDIO.sign(
         mensaje,
         padding.PKCS1v15(),
         hashes.SHA256()
     )
+
+# Firma un lote completo de mediciones con una sola operación RSA
+def firmar_lote(lote):
+    mensaje = json.dumps(lote, separators=(',', ':')).encode('utf-8')
     return {
-        "datos": datos,
-        "firma": base64.b64encode(firma).decode('utf-8')
+        "lote": lote,
+        "firma": base64.b64encode(firmar(mensaje)).decode('utf-8')
     }
 
-cola_envios = queue.Queue()
+# Arma el lote en el formato negociado con el servidor final
+def construir_paquete(lote, formato):
+    if formato == FORMATO_BINARIO:
+        cuerpo = cuerpo_lote(lote, CLAVE_PRIVADA_INTERMEDIO.key_size // 8)
+        return trama(cuerpo, firmar(cuerpo))
+    return json.dumps(firmar_lote(lote)).encode('utf-8') + b'\n'
+
+# Fragmentos de servidores finales; cada sensor va siempre al mismo según hashing consistente
+# sobre su id. Las réplicas de un fragmento solo se usan mientras el primario está caído:
+# lo que se guarda en una réplica queda ahí (los servidores finales no se sincronizan)
+FRAGMENTOS = normalizar_fragmentos(SERVIDORES_FINALES or [f"{SERVER_FINAL_IP}:{SERVER_FINAL_PUERTO}"])
+anillo = AnilloHash([destinos[0] for destinos in FRAGMENTOS])
+
+# Robustez en sistema: cola de envíos persistente para que no se pierdan datos aunque se caiga
+# el servidor final o se reinicie este proceso. Un spool por enlace de cada fragmento
+# (numerados fragmento * ENLACES_FINAL + enlace, así con un solo fragmento son las mismas
+# carpetas de siempre); cada sensor va siempre al mismo, así se mantiene el orden por sensor
+colas_envio = [
+    Spool(os.path.join(DIRECTORIO_SPOOL, str(i)), max_bytes=MAX_BYTES_SPOOL,
+          politica=POLITICA_SPOOL, usar_mmap=SPOOL_MMAP,
+          codificar=empaquetar_medicion, decodificar=desempaquetar_medicion)
+    for i in range(len(FRAGMENTOS) * ENLACES_FINAL)
+]
+
+def cola_de(sensor_id):
+    return colas_envio[anillo.fragmento(sensor_id) * ENLACES_FINAL + sensor_id % ENLACES_FINAL]
 
-# Robustez en sistema: usar cola constante para que no se pierdan datos
-def enviar_datos_cola():
+# Estado de salud de cada servidor final, compartido por todos los hilos que le envían
+circuitos_final = {destino: Circuito(UMBRAL_CIRCUITO, BACKOFF_MIN, BACKOFF_MAX, destino)
+                   for destinos in FRAGMENTOS for destino in destinos}
+
+# Métricas de cada etapa, expuestas en /metrics
+CONEXIONES = Contador("intermedio_conexiones_aceptadas_total", "Conexiones TCP aceptadas desde sensores")
+CONEXIONES_ACTIVAS = Medidor("intermedio_conexiones_activas", "Conexiones TCP de sensores abiertas")
+PAQUETES_INCOMPLETOS = Contador("intermedio_paquetes_incompletos_total",
+                                "Conexiones cerradas antes de recibir el paquete completo")
+CONEXIONES_EXPIRADAS = Contador("intermedio_conexiones_expiradas_total",
+                                "Conexiones y sesiones cerradas por pasar el timeout sin recibir datos")
+FIRMAS = Contador("intermedio_firmas_total", "Mensajes de sensores según el resultado de la firma", ("resultado",))
+SESIONES = Contador("intermedio_sesiones_total", "Sesiones de sensor abiertas con el protocolo de sesión")
+MENSAJES = Contador("intermedio_mensajes_total", "Mensajes firmados recibidos de sensores", ("tipo",))
+MEDICIONES_RECIBIDAS = Contador("intermedio_mediciones_recibidas_total", "Mediciones recibidas de sensores")
+DESCARTADAS = Contador("intermedio_mediciones_descartadas_total",
+                       "Mediciones repetidas, antiguas o con fecha futura descartadas antes de enviarlas", ("motivo",))
+Medidor("intermedio_repeticiones_sensores", "Sensores con ventana de repeticiones en memoria",
+        funcion=lambda: REPETICIONES.sensores() if REPETICIONES is not None else 0)
+VERIFICACION = Histograma("intermedio_verificacion_segundos", "Tiempo de verificar la firma RSA de un paquete")
+ENVIO_SEGUNDOS = Histograma("intermedio_envio_lote_segundos", "Tiempo de enviar un lote hasta la respuesta del final",
+                            ("destino",))
+LOTE_MEDICIONES = Histograma("intermedio_lote_mediciones", "Mediciones por lote enviado", buckets=BUCKETS_CANTIDAD)
+LOTES_ENVIADOS = Contador("intermedio_lotes_total", "Lotes terminados según la respuesta del final", ("resultado",))
+REINTENTOS = Contador("intermedio_envio_reintentos_total", "Intentos de envío de lote fallidos que se reintentan",
+                      ("destino",))
+REPLICA = Contador("intermedio_lotes_replica_total", "Lotes enviados a una réplica porque el primario no respondía",
+                   ("fragmento",))
+def etiquetas_cola(i):
+    return FRAGMENTOS[i // ENLACES_FINAL][0], str(i % ENLACES_FINAL)
+
+Medidor("intermedio_cola_envios", "Mediciones pendientes en la cola de envíos", ("fragmento", "enlace"),
+        funcion=lambda: {etiquetas_cola(i): cola.qsize() for i, cola in enumerate(colas_envio)})
+Medidor("intermedio_cola_envios_edad_segundos", "Antigüedad de la medición pendiente más vieja", ("fragmento", "enlace"),
+        funcion=lambda: {etiquetas_cola(i): cola.metricas()["edad_s"] for i, cola in enumerate(colas_envio)})
+Contador("intermedio_cola_envios_perdidas_total", "Mediciones que no entraron o salieron de la cola llena",
+         ("motivo",), funcion=lambda: {("rechazada",): sum(cola.rechazados for cola in colas_envio),
+                                       ("descartada",): sum(cola.descartados for cola in colas_envio)})
+Medidor("intermedio_circuito_abierto", "1 si el circuito hacia el servidor final no está cerrado", ("destino",),
+        funcion=lambda: {(d,): int(c.estado != 'cerrado') for d, c in circuitos_final.items()})
+Contador("intermedio_circuito_aperturas_total", "Veces que se abrió el circuito", ("destino",),
+         funcion=lambda: {(d,): c.aperturas for d, c in circuitos_final.items()})
+Contador("intermedio_claves_total", "Búsquedas en el registro de claves de sensores", ("resultado",),
+         funcion=lambda: {(nombre,): REGISTRO_CLAVES.estadisticas()[nombre] for nombre in ("aciertos", "fallos", "recargas")})
+
+def encolar_envio(datos):
+    if not cola_de(datos["id"]).put(datos):
+        log.warning("Cola de envíos llena, medición descartada")
+        return False
+    return True
+
+# Destino del fragmento para el próximo intento: el primero en orden (primario y después las
+# réplicas) cuyo circuito lo permita; si están todos abiertos espera al que se libere antes
+def elegir_destino(destinos):
     while True:
-        try:
-            datos = cola_envios.get(timeout=1)
-        except queue.Empty:
-            time.sleep(1)
+        for i, destino in enumerate(destinos):
+            if circuitos_final[destino].permite():
+                return i
+        time.sleep(min(circuitos_final[destino].restante() for destino in destinos) or BACKOFF_MIN)
+
+# Cada hilo mantiene una conexión persistente con cada destino de su fragmento y envía lotes
+# de hasta TAM_LOTE mediciones. El hilo se despierta apenas se encola algo (no hay sondeo con sleep)
+def enviar_datos_cola(cola, destinos):
+    enlaces = [EnlaceFinal(*parsear_destino(destino), timeout=2, binario=ENLACE_BINARIO) for destino in destinos]
+    actual = 0
+    while True:
+        lote = cola.leer_lote(TAM_LOTE, ESPERA_LOTE_MS)
+        if not lote:
             continue
 
-        try:
-            with socket.create_connection((SERVER_FINAL_IP, SERVER_FINAL_PUERTO), timeout=2) as s:
-                paquete_firmado = firmar_datos(datos)
-                paquete_final = json.dumps(paquete_firmado).encode('utf-8') + b'\n'
-                s.sendall(paquete_final)
-                print(f"Enviado desde cola: {datos}")
-        except Exception as e:
-            print(f"Error al enviar: {e}, devolviendo a cola")
-            cola_envios.put(datos)
-            time.sleep(5)  # evitar loop rápido si el servidor final está caído
-
-# Atender una conexión TCP desde el cliente sensor
-def recepcion_tcp(conex, dir):
-    print(f"conexion desde {dir}")
-    # 278 es tamaño exacto del paquete de datos + firma
-    # 22 el struct
-    # 256 firma
-    try:
-        paquete = b''
-        while len(paquete) < 278:
-            token = conex.recv((278) - len(paquete))
-            if not token:
+        paquetes = {}  # formato -> lote ya firmado, para no volver a firmar en cada reintento
+        # el lote se reintenta completo y en orden hasta que un servidor del fragmento lo confirme,
+        # así no se reordenan las mediciones de un sensor
+        while True:
+            i = elegir_destino(destinos)
+            if i != actual:
+                log.warning("Fragmento %s: enviando a %s", destinos[0], destinos[i])
+                actual = i
+            destino, enlace, circuito = destinos[i], enlaces[i], circuitos_final[destinos[i]]
+            try:
+                enlace.conectar()
+                if enlace.formato not in paquetes:
+                    paquetes[enlace.formato] = construir_paquete(lote, enlace.formato)
+                with ENVIO_SEGUNDOS.medir((destino,)):
+                    enlace.enviar_lote(paquetes[enlace.formato])
+                circuito.exito()
+                LOTES_ENVIADOS.inc(etiquetas=("ok",))
+                if i:
+                    REPLICA.inc(etiquetas=(destinos[0],))
+                log.debug("Enviado lote de %d mediciones a %s", len(lote), destino)
+                break
+            except LoteRechazado as e:
+                circuito.exito()
+                LOTES_ENVIADOS.inc(etiquetas=("rechazado",))
+                log.error("Error al enviar a %s: %s, lote descartado", destino, e)
                 break
-            paquete += token
+            except Exception as e:
+                REINTENTOS.inc(etiquetas=(destino,))
+                log.warning("Error al enviar a %s: %s, reintentando lote", destino, e)
+                time.sleep(circuito.fallo())
+        cola.confirmar()
+        LOTE_MEDICIONES.observar(len(lote))
+
+# Verifica una firma de sensor y encola las mediciones que cubre
+# registros: structs SensorData del mismo sensor; firmado: los bytes cubiertos por la firma
+def procesar_firmado(sensor_id, firmado, firma, registros, tipo):
+    MENSAJES.inc(etiquetas=(tipo,))
+    if REPETICIONES is not None:
+        instantes = [instante_registro(registro) for registro in registros]
+        clasificaciones = [REPETICIONES.revisar(sensor_id, instante) for instante in instantes]
+        # si no trae nada nuevo no vale la pena verificar la firma
+        if NUEVA not in clasificaciones:
+            for clasificacion in clasificaciones:
+                DESCARTADAS.inc(etiquetas=(clasificacion,))
+            log.debug("Sensor %s: %d mediciones repetidas, antiguas o futuras descartadas", sensor_id, len(registros))
+            return True
+    with VERIFICACION.medir():
+        valida = verificar_firma(firmado, firma, sensor_id)
+    FIRMAS.inc(etiquetas=("valida" if valida else "invalida",))
+    if not valida:
+        log.warning("Firma invalida del sensor %s, %d mediciones descartadas", sensor_id, len(registros))
+        return False
+    MEDICIONES_RECIBIDAS.inc(len(registros))
+    if REPETICIONES is not None:
+        # se vuelve a clasificar al registrar: otra conexión pudo aceptar la misma medición mientras tanto
+        nuevas = []
+        for registro, instante in zip(registros, instantes):
+            clasificacion = REPETICIONES.registrar(sensor_id, instante)
+            if clasificacion == NUEVA:
+                nuevas.append(registro)
+            else:
+                DESCARTADAS.inc(etiquetas=(clasificacion,))
+        registros = nuevas
+    log.debug("Firma válida, encolando %d mediciones", len(registros))
+    encoladas = [encolar_envio(parsear_datos_sensor(registro)) for registro in registros]
+    return all(encoladas)
+
+# Verificar y encolar un paquete antiguo completo (datos + firma)
+def procesar_paquete(paquete):
+    datos = paquete[:22]
+    return procesar_firmado(MARCA.unpack_from(datos)[0], datos, paquete[22:], [datos], "paquete")
+
+# Mensaje ya decodificado de una sesión
+def procesar_mensaje_sesion(sensor_id, mensaje):
+    tipo, firmado, firma, registros = mensaje
+    return procesar_firmado(sensor_id, firmado, firma, registros, "lote" if tipo == TIPO_LOTE else "medicion")
 
-        if len(paquete) < 278:
-            print("paquete incompleto!!!!")
+# Sesión persistente de un sensor en modo hilos: mensajes hasta que el sensor cierre
+def atender_sesion(conex, lector, dir):
+    decodificador = DecodificadorSesion()
+    cabecera = lector.leer_exacto(decodificador.necesita())
+    if cabecera is None:
+        PAQUETES_INCOMPLETOS.inc()
+        return
+    try:
+        decodificador.alimentar(cabecera)
+    except ErrorSesion as e:
+        log.warning("Sesión rechazada desde %s: %s", dir, e)
+        conex.sendall(RECHAZADA)
+        return
+    conex.sendall(aceptada(decodificador.version))
+    conex.settimeout(TIMEOUT_SESION)
+    SESIONES.inc()
+    log.debug("sesión del sensor %s desde %s", decodificador.sensor_id, dir)
+    while True:
+        datos = lector.leer_exacto(decodificador.necesita())
+        if datos is None:
+            if not decodificador.en_limite():
+                PAQUETES_INCOMPLETOS.inc()
+                log.warning("sesión del sensor %s cerrada con un mensaje a medias", decodificador.sensor_id)
+            return
+        try:
+            mensaje = decodificador.alimentar(datos)
+        except ErrorSesion as e:
+            log.warning("Sesión del sensor %s cerrada: %s", decodificador.sensor_id, e)
             return
+        if mensaje is not None:
+            procesar_mensaje_sesion(decodificador.sensor_id, mensaje)
 
-        datos = paquete[:22]
-        firma = paquete[22:]
-        parseado = parsear_datos_sensor(datos)
+# Atender una conexión TCP desde el cliente sensor: un paquete antiguo o una sesión
+def recepcion_tcp(conex, dir):
+    log.debug("conexion desde %s", dir)
+    CONEXIONES_ACTIVAS.inc()
+    try:
+        lector = LectorSocket(conex, tam_lectura=TAM_LECTURA_SESION)
+        inicio = lector.leer_exacto(MARCA.size)
+        if inicio is not None and es_sesion(inicio):
+            atender_sesion(conex, lector, dir)
+            return
+        resto = lector.leer_exacto(TAM_PAQUETE - MARCA.size) if inicio is not None else None
+        if resto is None:
+            PAQUETES_INCOMPLETOS.inc()
+            log.warning("paquete incompleto desde %s", dir)
+            return
 
-        if verificar_firma(datos, firma, parseado["id"]):
-            print("Firma válida, encolando paquete")
-            cola_envios.put(parseado)
-        else:
-            print("Firma invalida, datos descartados")
+        procesar_paquete(inicio + resto)
 
+    except TimeoutError:
+        # sesión inactiva más de TIMEOUT_SESION, es el cierre normal de un sensor que dejó de enviar
+        CONEXIONES_EXPIRADAS.inc()
+        log.debug("conexion desde %s expirada", dir)
     except Exception as e:
-        import traceback
-        print(f"Error en conexion: {e}")
-        traceback.print_exc()
+        log.exception("Error en conexion: %s", e)
     finally:
         conex.close()
+        CONEXIONES_ACTIVAS.dec()
 
 # bucle principal del servidor intermedio
 def servidor():
-    print(f"escuchando en {obtener_ip_servidor()}:{PUERTO}...")
-    threading.Thread(target=enviar_datos_cola, daemon=True).start()
+    log.info("escuchando en %s:%d...", obtener_ip_servidor(), PUERTO)
+    for i, cola in enumerate(colas_envio):
+        destinos = FRAGMENTOS[i // ENLACES_FINAL]
+        threading.Thread(target=enviar_datos_cola, args=(cola, destinos), daemon=True).start()
+    log.info("servidores finales: %s", "; ".join(", ".join(destinos) for destinos in FRAGMENTOS))
+    if PUERTO_METRICAS:
+        iniciar_servidor_metricas(obtener_ip_servidor(), PUERTO_METRICAS)
+        log.info("métricas en http://%s:%d/metrics", obtener_ip_servidor(), PUERTO_METRICAS)
+    if MODO_SERVIDOR == 'asyncio':
+        ingesta = IngestaAsync(procesar_paquete, TAM_PAQUETE, MAX_CONEXIONES, TIMEOUT_CONEXION, HILOS_VERIFICACION,
+                               procesar_sesion=procesar_mensaje_sesion, timeout_sesion=TIMEOUT_SESION)
+        # en este modo los contadores de conexiones los lleva IngestaAsync
+        CONEXIONES.funcion = lambda: ingesta.aceptadas
+        CONEXIONES_ACTIVAS.funcion = lambda: ingesta.activas
+        PAQUETES_INCOMPLETOS.funcion = lambda: ingesta.incompletas
+        CONEXIONES_EXPIRADAS.funcion = lambda: ingesta.expiradas
+        SESIONES.funcion = lambda: ingesta.sesiones
+        ingesta.iniciar(obtener_ip_servidor(), PUERTO)
+        return
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # permite reiniciar sin esperar TIME_WAIT
         s.bind((obtener_ip_servidor(), PUERTO))
         s.listen()
         while True:
             conex, dir = s.accept()
+            CONEXIONES.inc()
             threading.Thread(target=recepcion_tcp, args=(conex, dir), daemon=True).start()
 
 if __name__ == "__main__":
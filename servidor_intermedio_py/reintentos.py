@@ -0,0 +1,81 @@
+import logging
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+# Backoff exponencial con jitter completo: espera al azar entre minimo y minimo * 2^intentos,
+# con tope en maximo, para que varios emisores no reintenten todos al mismo tiempo
+class Backoff:
+    def __init__(self, minimo=0.05, maximo=2.0):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.intentos = 0
+
+    def siguiente(self):
+        tope = min(self.maximo, self.minimo * (2 ** self.intentos))
+        self.intentos += 1
+        return random.uniform(self.minimo, tope)
+
+    def reiniciar(self):
+        self.intentos = 0
+
+
+# Circuit breaker hacia el servidor final, compartido por todos los hilos que envían a él
+# cerrado: se envía normal. abierto: nadie intenta hasta que pase el backoff.
+# semiabierto: un solo hilo prueba; si funciona se cierra y los demás vuelven a enviar
+# en su próxima consulta a permite()
+class Circuito:
+    def __init__(self, umbral_fallos=3, backoff_min=0.05, backoff_max=2.0, destino="servidor final"):
+        self.destino = destino  # solo para los mensajes de log
+        self.umbral_fallos = umbral_fallos
+        self.backoff = Backoff(backoff_min, backoff_max)
+        self.estado = 'cerrado'
+        self.fallos_consecutivos = 0
+        self.fallos = 0
+        self.aperturas = 0
+        self._abierto_hasta = 0.0
+        self._lock = threading.Lock()
+
+    # True si este hilo puede intentar ahora, sin bloquear (circuito cerrado, o abierto
+    # con el backoff cumplido y este hilo pasa a ser la prueba)
+    def permite(self):
+        with self._lock:
+            if self.estado == 'cerrado':
+                return True
+            if self.estado == 'abierto' and self._abierto_hasta <= time.monotonic():
+                self.estado = 'semiabierto'
+                return True
+            return False
+
+    # Segundos hasta que permite() pueda volver a dar True
+    def restante(self):
+        with self._lock:
+            if self.estado == 'abierto':
+                return max(0.0, self._abierto_hasta - time.monotonic())
+            return 0.0 if self.estado == 'cerrado' else self.backoff.minimo
+
+    def exito(self):
+        with self._lock:
+            self.fallos_consecutivos = 0
+            self.backoff.reiniciar()
+            if self.estado != 'cerrado':
+                log.info("%s disponible de nuevo, circuito cerrado", self.destino)
+            self.estado = 'cerrado'
+
+    # Registra un fallo y devuelve cuánto debe esperar el hilo que falló antes de reintentar
+    def fallo(self):
+        with self._lock:
+            self.fallos += 1
+            self.fallos_consecutivos += 1
+            espera = self.backoff.siguiente()
+            if self.estado == 'semiabierto' or self.fallos_consecutivos >= self.umbral_fallos:
+                if self.estado == 'cerrado':
+                    self.aperturas += 1
+                    log.warning("%s no responde, circuito abierto tras %d fallos", self.destino, self.fallos_consecutivos)
+                self.estado = 'abierto'
+                self._abierto_hasta = time.monotonic() + espera
+                return 0  # la espera la impone permite(): no deja intentar hasta _abierto_hasta
+            return espera
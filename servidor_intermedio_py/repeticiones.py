@@ -0,0 +1,141 @@
+import calendar
+import heapq
+import struct
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+NUEVA = 'nueva'
+DUPLICADA = 'duplicada'
+ANTIGUA = 'antigua'
+FUTURA = 'futura'
+
+
+# Timestamp AAAAMMDDHHMMSS de un struct SensorData -> segundos, None si no es una fecha válida
+def instante_registro(registro):
+    valor, = struct.unpack_from('<Q', registro, 2)
+    fecha, hora = divmod(valor, 1000000)
+    try:
+        return int(datetime(fecha // 10000, fecha // 100 % 100, fecha % 100,
+                            hora // 10000, hora // 100 % 100, hora % 100, tzinfo=timezone.utc).timestamp())
+    except ValueError:
+        return None
+
+# Ahora en la misma escala que instante_registro: los sensores ponen su hora local sin zona
+def ahora_local():
+    return calendar.timegm(time.localtime())
+
+
+# Ventana de un sensor: instantes aceptados dentro de la ventana y el más reciente visto
+class _VentanaSensor:
+    __slots__ = ("maximo", "piso", "vistos", "heap", "candidatos")
+
+    def __init__(self):
+        self.maximo = None
+        self.piso = None  # instantes <= piso ya no se pueden distinguir de una repetición
+        self.vistos = set()
+        self.heap = []
+        self.candidatos = []  # lecturas seguidas que apuntan a un cambio de reloj
+
+
+# Memoria de mediciones ya aceptadas por sensor, para cortar repeticiones y reenvíos antes de
+# verificar la firma y mandarlas al servidor final (que igual las descartaría por UNIQUE)
+# Por sensor guarda los instantes aceptados hasta `ventana` segundos detrás del más reciente;
+# lo anterior a eso se rechaza como antiguo. Si un sensor supera max_por_sensor instantes se
+# olvidan los más viejos y pasan a ser antiguos, así la memoria queda acotada sin dejar pasar
+# repeticiones. Los sensores se mantienen en un LRU de max_sensores: al expulsar uno se pierde
+# su ventana y sus repeticiones vuelven a llegar al final, donde las frena la base de datos
+# Para que un timestamp erróneo no deje al sensor sin datos:
+# - lo que viene más de max_adelanto segundos adelante del reloj del servidor se rechaza
+#   como futuro y no mueve la ventana
+# - un salto hacia atrás de más de salto_reloj segundos (cambio de hora, reloj corregido) se
+#   toma como un reloj nuevo solo si la hora nueva está a menos de salto_reloj del reloj del
+#   servidor y la confirman `confirmaciones` lecturas seguidas con firma válida; entonces la
+#   ventana del sensor empieza de cero. Las lecturas previas a la confirmación se descartan
+#   como antiguas, y una trama vieja repetida nunca reinicia la ventana
+class VentanaRepeticiones:
+    def __init__(self, ventana=300, max_por_sensor=4096, max_sensores=10000, max_adelanto=86400,
+                 salto_reloj=1800, confirmaciones=3, reloj=ahora_local):
+        self.ventana = ventana
+        self.max_por_sensor = max_por_sensor
+        self.max_sensores = max_sensores
+        self.max_adelanto = max_adelanto
+        self.salto_reloj = max(salto_reloj, ventana)
+        self.confirmaciones = confirmaciones
+        self.reloj = reloj
+        self._sensores = OrderedDict()  # sensor_id -> _VentanaSensor
+        self._lock = threading.Lock()
+
+    # NUEVA, DUPLICADA, ANTIGUA o FUTURA sin registrar nada (para descartar antes de verificar la firma)
+    def revisar(self, sensor_id, instante):
+        with self._lock:
+            return self._clasificar(self._sensores.get(sensor_id), instante)
+
+    # Igual que revisar, pero si es nueva la registra como aceptada
+    # Solo se registran mediciones con firma válida: una firma falsa no mueve la ventana
+    # ni cuenta para confirmar un cambio de reloj
+    def registrar(self, sensor_id, instante):
+        with self._lock:
+            estado = self._sensores.get(sensor_id)
+            if estado is None:
+                estado = self._sensores[sensor_id] = _VentanaSensor()
+                if len(self._sensores) > self.max_sensores:
+                    self._sensores.popitem(last=False)
+            else:
+                self._sensores.move_to_end(sensor_id)
+            clasificacion = self._clasificar(estado, instante)
+            if clasificacion == NUEVA and self._cambio_de_reloj(estado, instante):
+                if not self._confirmar_reloj(estado, instante):
+                    return ANTIGUA
+                estado = self._sensores[sensor_id] = _VentanaSensor()
+            elif clasificacion == NUEVA:
+                estado.candidatos.clear()
+            if clasificacion == NUEVA and instante is not None:
+                estado.vistos.add(instante)
+                heapq.heappush(estado.heap, instante)
+                if estado.maximo is None or instante > estado.maximo:
+                    estado.maximo = instante
+                self._recortar(estado)
+            return clasificacion
+
+    def sensores(self):
+        with self._lock:
+            return len(self._sensores)
+
+    def _clasificar(self, estado, instante):
+        # sin fecha válida no hay cómo compararla: pasa y la resuelve el servidor final
+        if instante is None:
+            return NUEVA
+        if instante > self.reloj() + self.max_adelanto:
+            return FUTURA
+        if estado is None or estado.maximo is None:
+            return NUEVA
+        if instante in estado.vistos:
+            return DUPLICADA
+        if self._cambio_de_reloj(estado, instante):
+            # pasa a verificar la firma: registrar decide si confirma el cambio de reloj
+            return NUEVA if abs(instante - self.reloj()) <= self.salto_reloj else ANTIGUA
+        if instante < estado.maximo - self.ventana or (estado.piso is not None and instante <= estado.piso):
+            return ANTIGUA
+        return NUEVA
+
+    def _cambio_de_reloj(self, estado, instante):
+        return estado.maximo is not None and instante is not None and instante < estado.maximo - self.salto_reloj
+
+    # Cada candidato debe ser posterior al anterior y estar a menos de `ventana` de él;
+    # si no, la secuencia empieza de nuevo desde este. True al llegar a `confirmaciones`
+    def _confirmar_reloj(self, estado, instante):
+        candidatos = estado.candidatos
+        if candidatos and not candidatos[-1] < instante <= candidatos[-1] + self.ventana:
+            candidatos.clear()
+        candidatos.append(instante)
+        return len(candidatos) >= self.confirmaciones
+
+    def _recortar(self, estado):
+        limite = estado.maximo - self.ventana
+        while estado.heap and (estado.heap[0] < limite or len(estado.heap) > self.max_por_sensor):
+            olvidado = heapq.heappop(estado.heap)
+            estado.vistos.discard(olvidado)
+            if olvidado >= limite:
+                estado.piso = olvidado if estado.piso is None else max(estado.piso, olvidado)
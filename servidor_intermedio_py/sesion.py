@@ -0,0 +1,97 @@
+import struct
+
+# Protocolo de sesión sensor -> intermedio (versión 1)
+#
+# El paquete antiguo (un struct SensorData de 22 bytes + firma de 256 por conexión) se sigue
+# aceptando. Una sesión empieza con un sensor_id -1, que nunca es un sensor válido:
+#   cabecera: marca i16 (-1) | versión u8 | sensor_id i16
+# el intermedio responde un byte: la versión aceptada, o 0 si no la soporta (y cierra).
+# Después el sensor envía mensajes mientras mantenga la conexión abierta:
+#   medición: tipo u8 (1) | registro (22) | firma (256)       firma sobre el registro, como el paquete antiguo
+#   lote:     tipo u8 (2) | cantidad u16 | registros | firma   firma sobre todo lo anterior a la firma
+# Todos los registros deben ser del sensor de la cabecera y se verifican con su clave.
+
+MARCA_SESION = -1
+VERSION_SESION = 1
+MARCA = struct.Struct('<h')
+CABECERA = struct.Struct('<hBh')
+CANTIDAD = struct.Struct('<H')
+TIPO_MEDICION = 1
+TIPO_LOTE = 2
+TAM_REGISTRO = 22
+TAM_FIRMA = 256
+MAX_LOTE = 1000  # registros máximos por lote
+RECHAZADA = b'\x00'
+
+
+class ErrorSesion(Exception):
+    pass
+
+
+def es_sesion(inicio):
+    return MARCA.unpack_from(inicio)[0] == MARCA_SESION
+
+def aceptada(version=VERSION_SESION):
+    return bytes([version])
+
+
+# Decodificador de una sesión sin E/S: dice cuántos bytes necesita a continuación y
+# recibe exactamente esos bytes, así sirve igual para sockets bloqueantes y para asyncio
+# Uso: se crea después de leer la marca; alimentar() devuelve (tipo, firmado, firma, registros)
+# cuando completa un mensaje y None mientras tanto
+class DecodificadorSesion:
+    def __init__(self):
+        self.sensor_id = None
+        self.version = None
+        self._estado = 'cabecera'
+        self._faltan = CABECERA.size - MARCA.size
+        self._tipo = None
+        self._cantidad = b''
+
+    def necesita(self):
+        return self._faltan
+
+    # True si no hay un mensaje a medias (la conexión se puede cerrar aquí sin perder nada)
+    def en_limite(self):
+        return self._estado == 'tipo'
+
+    def alimentar(self, datos):
+        if self._estado == 'cabecera':
+            self.version, self.sensor_id = struct.unpack('<Bh', datos)
+            if self.version != VERSION_SESION:
+                raise ErrorSesion(f"versión de sesión no soportada: {self.version}")
+            return self._esperar('tipo', 1)
+
+        if self._estado == 'tipo':
+            self._tipo = datos[0]
+            if self._tipo == TIPO_MEDICION:
+                return self._esperar('cuerpo', TAM_REGISTRO + TAM_FIRMA)
+            if self._tipo == TIPO_LOTE:
+                return self._esperar('cantidad', CANTIDAD.size)
+            raise ErrorSesion(f"tipo de mensaje desconocido: {self._tipo}")
+
+        if self._estado == 'cantidad':
+            cantidad, = CANTIDAD.unpack(datos)
+            if not 0 < cantidad <= MAX_LOTE:
+                raise ErrorSesion(f"lote de {cantidad} registros, máximo {MAX_LOTE}")
+            self._cantidad = datos
+            return self._esperar('cuerpo', cantidad * TAM_REGISTRO + TAM_FIRMA)
+
+        firma = datos[-TAM_FIRMA:]
+        registros = datos[:-TAM_FIRMA]
+        if self._tipo == TIPO_MEDICION:
+            firmado = registros
+        else:
+            firmado = bytes([TIPO_LOTE]) + self._cantidad + registros
+        registros = [registros[i:i + TAM_REGISTRO] for i in range(0, len(registros), TAM_REGISTRO)]
+        for registro in registros:
+            if struct.unpack_from('<h', registro)[0] != self.sensor_id:
+                raise ErrorSesion(f"registro de otro sensor en la sesión de {self.sensor_id}")
+        tipo = self._tipo
+        self._esperar('tipo', 1)
+        return tipo, firmado, firma, registros
+
+    def _esperar(self, estado, cantidad):
+        self._estado = estado
+        self._faltan = cantidad
+        return None
@@ -0,0 +1,299 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Cabecera de cada registro: largo de los datos, crc32 de los datos y hora de encolado
+CABECERA = struct.Struct('<IId')
+ARCHIVO_POSICION = "posicion"
+TAM_LECTURA = 256 * 1024
+
+
+def codificar_json(item):
+    return json.dumps(item, separators=(',', ':')).encode('utf-8')
+
+
+def decodificar_json(datos):
+    return json.loads(bytes(datos).decode('utf-8'))
+
+
+# Cola de envíos persistente en disco (append-only, por segmentos)
+# Los registros se escriben al final del segmento activo; el consumidor lee lotes y recién
+# los da por entregados con confirmar(), así un reinicio retoma desde lo no confirmado.
+# Un solo consumidor por spool: el orden de lectura es el orden de escritura
+class Spool:
+    def __init__(self, directorio, tam_segmento=4 * 1024 * 1024, max_bytes=256 * 1024 * 1024,
+                 politica='rechazar', usar_mmap=False, sincronizar=False,
+                 codificar=codificar_json, decodificar=decodificar_json):
+        if politica not in ('rechazar', 'descartar_antiguos'):
+            raise ValueError(f"politica de desborde desconocida: {politica}")
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.tam_segmento = min(tam_segmento, max_bytes // 2)  # al descartar siempre queda un segmento activo
+        self.politica = politica
+        self.usar_mmap = usar_mmap
+        self.sincronizar = sincronizar
+        self.codificar = codificar
+        self.decodificar = decodificar
+        self._cond = threading.Condition()
+        self.rechazados = 0
+        self.descartados = 0
+        os.makedirs(directorio, exist_ok=True)
+        self._cargar()
+
+    def _ruta(self, segmento):
+        return os.path.join(self.directorio, f"{segmento:012d}.seg")
+
+    def _segmentos(self):
+        return sorted(int(nombre[:-4]) for nombre in os.listdir(self.directorio) if nombre.endswith(".seg"))
+
+    # Recorre los registros válidos de un segmento desde offset; devuelve (offset_final, cantidad)
+    def _escanear(self, segmento, offset=0):
+        cantidad = 0
+        with open(self._ruta(segmento), "rb") as f:
+            datos = f.read()
+        while offset + CABECERA.size <= len(datos):
+            largo, crc, _ = CABECERA.unpack_from(datos, offset)
+            fin = offset + CABECERA.size + largo
+            if fin > len(datos) or zlib.crc32(datos[offset + CABECERA.size:fin]) != crc:
+                break
+            offset = fin
+            cantidad += 1
+        return offset, cantidad
+
+    # Reconstruye el estado a partir de los archivos: posición confirmada y registros pendientes
+    def _cargar(self):
+        segmentos = self._segmentos()
+        confirmado = None
+        try:
+            with open(os.path.join(self.directorio, ARCHIVO_POSICION), "r") as f:
+                segmento, offset, indice = (int(x) for x in f.read().split())
+            if segmento in segmentos:
+                confirmado = (segmento, offset, indice)
+        except (FileNotFoundError, ValueError):
+            pass
+        if confirmado is None:
+            confirmado = (segmentos[0] if segmentos else 1, 0, 0)
+
+        # lo anterior a la posición confirmada ya se entregó
+        for segmento in segmentos:
+            if segmento < confirmado[0]:
+                os.remove(self._ruta(segmento))
+        segmentos = [s for s in segmentos if s >= confirmado[0]] or [confirmado[0]]
+
+        self._registros = {}  # segmento -> registros válidos que contiene
+        self._tamanos = {}  # segmento -> bytes válidos
+        pendientes = 0
+        total_bytes = 0
+        for segmento in segmentos:
+            if not os.path.exists(self._ruta(segmento)):
+                open(self._ruta(segmento), "wb").close()
+            fin, cantidad = self._escanear(segmento)
+            if fin != os.path.getsize(self._ruta(segmento)):
+                # escritura cortada por una caída: se descarta la cola incompleta
+                with open(self._ruta(segmento), "r+b") as f:
+                    f.truncate(fin)
+            self._registros[segmento] = cantidad
+            self._tamanos[segmento] = fin
+            pendientes += cantidad
+            total_bytes += fin
+        pendientes -= confirmado[2]
+        total_bytes -= confirmado[1]
+
+        self._confirmado = confirmado
+        self._lectura = confirmado
+        self._pendientes = pendientes
+        self._sin_leer = pendientes
+        self._bytes = total_bytes
+        self._bytes_leidos = 0
+        self._leidos = 0
+        self._segmento_escritura = segmentos[-1]
+        self._archivo = open(self._ruta(self._segmento_escritura), "ab")
+        self._lector = None  # (segmento, fd, mmap o None)
+
+    def _rotar(self):
+        self._archivo.close()
+        self._segmento_escritura += 1
+        self._registros[self._segmento_escritura] = 0
+        self._tamanos[self._segmento_escritura] = 0
+        self._archivo = open(self._ruta(self._segmento_escritura), "ab")
+
+    # Política descartar_antiguos: se eliminan segmentos completos desde el más antiguo
+    def _descartar_antiguos(self, necesario):
+        while self._bytes + necesario > self.max_bytes:
+            if self._confirmado[0] == self._segmento_escritura:
+                self._rotar()
+            segmento, offset, indice = self._confirmado
+            perdidos = self._registros[segmento] - indice
+            if self._lectura[0] == segmento:
+                self._sin_leer -= self._registros[segmento] - self._lectura[2]
+                self._bytes_leidos = 0
+                self._leidos = 0
+                self._lectura = (segmento + 1, 0, 0)
+            else:
+                # lo ya leído de este segmento se sigue enviando, pero no se cuenta dos veces
+                self._bytes_leidos -= self._tamanos[segmento] - offset
+                self._leidos -= perdidos
+            self._pendientes -= perdidos
+            self._bytes -= self._tamanos[segmento] - offset
+            self.descartados += perdidos
+            self._cerrar_lector(segmento)
+            os.remove(self._ruta(segmento))
+            del self._registros[segmento], self._tamanos[segmento]
+            self._confirmado = (segmento + 1, 0, 0)
+            self._guardar_posicion()
+
+    # Agrega un elemento al final; devuelve False si se rechazó por falta de espacio
+    def put(self, item):
+        datos = self.codificar(item)
+        registro = CABECERA.pack(len(datos), zlib.crc32(datos), time.time()) + datos
+        with self._cond:
+            if self._bytes + len(registro) > self.max_bytes:
+                if self.politica == 'rechazar' or len(registro) > self.tam_segmento:
+                    self.rechazados += 1
+                    return False
+                self._descartar_antiguos(len(registro))
+            if self._tamanos[self._segmento_escritura] and \
+                    self._tamanos[self._segmento_escritura] + len(registro) > self.tam_segmento:
+                self._rotar()
+            self._archivo.write(registro)
+            self._archivo.flush()
+            if self.sincronizar:
+                os.fsync(self._archivo.fileno())
+            self._registros[self._segmento_escritura] += 1
+            self._tamanos[self._segmento_escritura] += len(registro)
+            self._pendientes += 1
+            self._sin_leer += 1
+            self._bytes += len(registro)
+            self._cond.notify()
+        return True
+
+    def _cerrar_lector(self, segmento=None):
+        if self._lector is not None and (segmento is None or self._lector[0] == segmento):
+            _, fd, mapa = self._lector
+            if mapa is not None:
+                mapa.close()
+            os.close(fd)
+            self._lector = None
+
+    # Bytes del segmento desde offset (a lo más TAM_LECTURA sin mmap); los segmentos
+    # cerrados se pueden leer con mmap sin copiar
+    def _contenido(self, segmento, offset):
+        if self._lector is None or self._lector[0] != segmento:
+            self._cerrar_lector()
+            fd = os.open(self._ruta(segmento), os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+            mapa = None
+            if self.usar_mmap and segmento != self._segmento_escritura and self._tamanos[segmento]:
+                mapa = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            self._lector = (segmento, fd, mapa)
+        _, fd, mapa = self._lector
+        if mapa is not None:
+            return memoryview(mapa)[offset:self._tamanos[segmento]]
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, min(TAM_LECTURA, self._tamanos[segmento] - offset))
+
+    def _leer(self, cantidad):
+        items = []
+        segmento, offset, indice = self._lectura
+        while len(items) < cantidad:
+            if indice >= self._registros[segmento]:
+                segmento, offset, indice = segmento + 1, 0, 0
+                continue
+            contenido = self._contenido(segmento, offset)
+            posicion = 0
+            while len(items) < cantidad and indice < self._registros[segmento]:
+                if posicion + CABECERA.size > len(contenido):
+                    break
+                largo, _, _ = CABECERA.unpack_from(contenido, posicion)
+                inicio = posicion + CABECERA.size
+                if inicio + largo > len(contenido):
+                    if posicion == 0:
+                        # registro más grande que un bloque de lectura
+                        os.lseek(self._lector[1], offset, os.SEEK_SET)
+                        contenido = os.read(self._lector[1], inicio + largo)
+                    else:
+                        break
+                items.append(self.decodificar(contenido[inicio:inicio + largo]))
+                posicion = inicio + largo
+                indice += 1
+            if isinstance(contenido, memoryview):
+                contenido.release()
+            offset += posicion
+            self._bytes_leidos += posicion
+        self._lectura = (segmento, offset, indice)
+        self._sin_leer -= len(items)
+        self._leidos += len(items)
+        return items
+
+    # Lee hasta tam_lote elementos sin confirmarlos. Espera timeout segundos al primero y
+    # después como máximo espera_ms para completar el lote. Se despierta apenas se encola algo
+    def leer_lote(self, tam_lote, espera_ms=0, timeout=1):
+        with self._cond:
+            if not self._sin_leer:
+                self._cond.wait(timeout)
+                if not self._sin_leer:
+                    return []
+            limite = time.monotonic() + espera_ms / 1000
+            while self._sin_leer < tam_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self._cond.wait(restante)
+            return self._leer(min(tam_lote, self._sin_leer))
+
+    # Marca como entregado todo lo leído hasta ahora
+    def confirmar(self):
+        with self._cond:
+            self._pendientes -= self._leidos
+            self._bytes -= self._bytes_leidos
+            self._leidos = 0
+            self._bytes_leidos = 0
+            self._confirmado = self._lectura
+            for segmento in [s for s in self._registros if s < self._confirmado[0]]:
+                self._cerrar_lector(segmento)
+                os.remove(self._ruta(segmento))
+                del self._registros[segmento], self._tamanos[segmento]
+            self._guardar_posicion()
+
+    def _guardar_posicion(self):
+        ruta = os.path.join(self.directorio, ARCHIVO_POSICION)
+        with open(ruta + ".tmp", "w") as f:
+            f.write("%d %d %d" % self._confirmado)
+            if self.sincronizar:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(ruta + ".tmp", ruta)
+
+    def qsize(self):
+        with self._cond:
+            return self._pendientes
+
+    # Profundidad, bytes en disco y antigüedad del registro pendiente más viejo
+    def metricas(self):
+        with self._cond:
+            edad = 0.0
+            segmento, offset, indice = self._confirmado
+            if self._pendientes:
+                while indice >= self._registros.get(segmento, 0) and segmento < self._segmento_escritura:
+                    segmento, offset, indice = segmento + 1, 0, 0
+                with open(self._ruta(segmento), "rb") as f:
+                    f.seek(offset)
+                    _, _, encolado = CABECERA.unpack(f.read(CABECERA.size))
+                edad = max(0.0, time.time() - encolado)
+            return {
+                "profundidad": self._pendientes,
+                "sin_leer": self._sin_leer,
+                "bytes": self._bytes,
+                "edad_s": edad,
+                "segmentos": len(self._registros),
+                "rechazados": self.rechazados,
+                "descartados": self.descartados
+            }
+
+    def cerrar(self):
+        with self._cond:
+            self._cerrar_lector()
+            self._archivo.close()
@@ -0,0 +1,68 @@
+import struct
+from datetime import datetime, timedelta
+
+from repeticiones import ANTIGUA, DUPLICADA, FUTURA, NUEVA, VentanaRepeticiones, instante_registro
+
+SENSOR = 101
+AHORA = datetime(2026, 10, 25, 3, 30, 0)
+
+
+def instante(fecha):
+    return instante_registro(struct.pack('<hQfff', SENSOR, int(fecha.strftime("%Y%m%d%H%M%S")), 20.0, 1000.0, 50.0))
+
+def ventana():
+    return VentanaRepeticiones(ventana=300, reloj=lambda: instante(AHORA))
+
+
+def test_repetida_y_antigua():
+    v = ventana()
+    base = AHORA - timedelta(hours=1)
+    assert v.registrar(SENSOR, instante(base)) == NUEVA
+    assert v.registrar(SENSOR, instante(base)) == DUPLICADA
+    assert v.registrar(SENSOR, instante(base + timedelta(seconds=600))) == NUEVA
+    assert v.registrar(SENSOR, instante(base + timedelta(seconds=200))) == ANTIGUA
+
+
+# Una lectura fechada en 2099 no puede dejar como antiguas a las lecturas reales que siguen
+def test_fecha_futura_no_mueve_la_ventana():
+    v = ventana()
+    assert v.registrar(SENSOR, instante(AHORA)) == NUEVA
+    assert v.revisar(SENSOR, instante(datetime(2099, 1, 1))) == FUTURA
+    assert v.registrar(SENSOR, instante(datetime(2099, 1, 1))) == FUTURA
+    for segundos in range(5, 60, 5):
+        assert v.registrar(SENSOR, instante(AHORA + timedelta(seconds=segundos))) == NUEVA
+
+
+# Fin del horario de verano: la hora local del sensor y la del servidor vuelven de 02:59:55
+# a 02:00:05. Tras las lecturas que confirman el cambio, el sensor sigue guardando datos
+def test_cambio_de_hora_reinicia_la_ventana():
+    reloj = [0]
+    v = VentanaRepeticiones(ventana=300, confirmaciones=3, reloj=lambda: reloj[0])
+    inicio = datetime(2026, 10, 25, 2, 0, 0)
+    for segundos in range(0, 3600, 5):
+        reloj[0] = instante(inicio + timedelta(seconds=segundos))
+        assert v.registrar(SENSOR, reloj[0]) == NUEVA
+    despues = inicio + timedelta(seconds=5)
+    clasificaciones = []
+    for segundos in range(0, 3600, 5):
+        reloj[0] = instante(despues + timedelta(seconds=segundos))
+        clasificaciones.append(v.registrar(SENSOR, reloj[0]))
+    assert clasificaciones[:2] == [ANTIGUA, ANTIGUA]
+    assert set(clasificaciones[2:]) == {NUEVA}
+    # la ventana nueva sigue frenando repeticiones
+    assert v.registrar(SENSOR, instante(despues + timedelta(seconds=3590))) == DUPLICADA
+
+
+# Tramas viejas capturadas no pueden hacerse pasar por un cambio de reloj ni borrar la ventana
+def test_repeticion_de_tramas_viejas():
+    v = ventana()
+    t = AHORA - timedelta(seconds=5)
+    assert v.registrar(SENSOR, instante(t)) == NUEVA
+    assert v.registrar(SENSOR, instante(t + timedelta(seconds=5))) == NUEVA
+    for _ in range(5):
+        for atraso in (3600, 7200):
+            vieja = instante(t - timedelta(seconds=atraso))
+            assert v.revisar(SENSOR, vieja) == ANTIGUA
+            assert v.registrar(SENSOR, vieja) == ANTIGUA
+    assert v.revisar(SENSOR, instante(t)) == DUPLICADA
+    assert v.registrar(SENSOR, instante(t)) == DUPLICADA